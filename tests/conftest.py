@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The app is a folder of flat modules run as scripts, import them the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "yt-downloader"))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def fixture_path(*parts):
+    return os.path.join(FIXTURES, *parts)
+
+def read_fixture(*parts):
+    with open(fixture_path(*parts), "r") as f:
+        return f.read()
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append({"method": "GET", "path": self.path, "headers": dict(self.headers)})
+        route = self.server.routes.get(self.path.split("?")[0])
+        if route is None:
+            self._send(404, "not found", "text/plain")
+            return
+        self._send(200, route, "text/html; charset=utf-8")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        self.server.requests.append({"method": "POST", "path": self.path, "body": body})
+        answer = self.server.on_post(self.path, body) if self.server.on_post else None
+        if answer is None:
+            self._send(500, "{}", "application/json")
+            return
+        self._send(200, answer, "application/json")
+
+@pytest.fixture
+def http_stand_in():
+    # Local server answering GETs from a {path: body} map and POSTs through on_post(path, body)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    server.routes = {}
+    server.on_post = None
+    server.requests = []
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
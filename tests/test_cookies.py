@@ -0,0 +1,12 @@
+from cookies import is_auth_error
+
+def test_sign_in_errors_refresh_cookies():
+    assert is_auth_error(["ERROR: [youtube] abc: Sign in to confirm your age. This video may be inappropriate"])
+    assert is_auth_error(["ERROR: [youtube] abc: Join this channel to get access to members-only content"])
+    assert is_auth_error(["ERROR: unable to download video data: HTTP Error 401: Unauthorized"])
+
+def test_media_and_bot_errors_do_not():
+    # googlevideo answers 403 for expired or throttled media URLs
+    assert not is_auth_error(["ERROR: unable to download video data: HTTP Error 403: Forbidden"])
+    assert not is_auth_error(["ERROR: [youtube] abc: Sign in to confirm you're not a bot. Use --cookies-from-browser"])
+    assert not is_auth_error([])
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from conftest import read_fixture
+from discovery import channel_name_of, collect, discover_channel, filter_items, parse_page
+
+CHANNEL_PATH = "/channel/UCtopicChannel000000000a"
+SHELF_PARAMS = "EglwbGF5bGlzdHMYAyABcgA%3D"
+CONTINUATION = "4qmFsgJhEhhVQ3RvcGljQ2hhbm5lbDAwMDAwMDAwMGE"
+
+def playlist_url(playlist_id):
+    return f"https://www.youtube.com/playlist?list={playlist_id}"
+
+def channel_data():
+    data, config = parse_page(read_fixture("discovery", "channel.html"))
+    return data
+
+def browse_answers(path, body):
+    if not path.startswith("/youtubei/v1/browse"):
+        return None
+    if body.get("continuation") == CONTINUATION:
+        return read_fixture("discovery", "continuation.json")
+    if body.get("params") == SHELF_PARAMS:
+        return read_fixture("discovery", "shelf.json")
+    return None
+
+@pytest.fixture
+def youtube(http_stand_in):
+    http_stand_in.routes[CHANNEL_PATH] = read_fixture("discovery", "channel.html")
+    http_stand_in.on_post = browse_answers
+    return http_stand_in
+
+def test_parse_page_reads_initial_data_and_config():
+    data, config = parse_page(read_fixture("discovery", "channel.html"))
+    assert data["metadata"]["channelMetadataRenderer"]["externalId"] == "UCtopicChannel000000000a"
+    assert config["INNERTUBE_API_KEY"] == "fixture-key"
+
+def test_collect_finds_items_shelves_and_continuations():
+    items, continuations, shelves = collect(channel_data())
+    assert [(i["kind"], i["id"]) for i in items] == [
+        ("playlist", "OLAK5uy_albumOne0000000000000000000000000"),
+        ("playlist", "OLAK5uy_albumLockup000000000000000000000000"),
+        ("video", "dQw4w9WgXcQ"),
+        ("playlist", "OLAK5uy_epFromWatch000000000000000000000000"),
+        ("playlist", "short"),
+    ]
+    assert items[0]["count"] == 12 and items[0]["title"] == "Album One"
+    assert items[1]["count"] == 8 and items[1]["title"] == "Lockup Album"
+    assert items[2]["duration"] == 225 and items[2]["title"] == "Single Song"
+    assert continuations == []
+    assert shelves == [{"browseId": "UCtopicChannel000000000a", "params": SHELF_PARAMS}]
+
+    items, continuations, shelves = collect(json.loads(read_fixture("discovery", "shelf.json")))
+    assert continuations == [CONTINUATION]
+    assert shelves == []
+    items, continuations, shelves = collect(json.loads(read_fixture("discovery", "continuation.json")))
+    assert items[0]["title"] == "Album Three" and items[0]["count"] == 1024
+
+def test_filter_items_dedupes_and_drops_malformed_ids():
+    links = filter_items([
+        {"kind": "playlist", "id": "OLAK5uy_albumOne0000000000000000000000000", "title": None, "count": None, "duration": None},
+        {"kind": "playlist", "id": "OLAK5uy_albumOne0000000000000000000000000", "title": "Album One", "count": 12, "duration": None},
+        {"kind": "playlist", "id": "short", "title": "Broken", "count": 3, "duration": None},
+        {"kind": "video", "id": "dQw4w9WgXcQ", "title": "Single Song", "count": 1, "duration": 225},
+        {"kind": "video", "id": "tooShortId", "title": "Broken", "count": 1, "duration": 10},
+    ])
+    assert links == [
+        {"url": playlist_url("OLAK5uy_albumOne0000000000000000000000000"), "title": "Album One",
+         "id": "OLAK5uy_albumOne0000000000000000000000000", "track_count": 12},
+        {"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "title": "Single Song", "id": "dQw4w9WgXcQ",
+         "track_count": 1, "duration": 225},
+    ]
+
+def test_channel_name_of_strips_topic_suffix():
+    assert channel_name_of(channel_data()) == "Some Artist"
+    assert channel_name_of({"metadata": {"channelMetadataRenderer": {"title": "AC/DC: Live - Topic"}}}) == "AC_DC_ Live"
+
+def test_channel_name_of_falls_back_to_header():
+    data = channel_data()
+    del data["metadata"]
+    assert channel_name_of(data) == "Some Artist"
+    assert channel_name_of({}) is None
+    assert channel_name_of(None) is None
+
+def test_discover_channel_follows_shelves_and_continuations(youtube):
+    result = discover_channel(youtube.base_url + CHANNEL_PATH)
+    assert result["channel_name"] == "Some Artist"
+    assert result["channel_id"] == "UCtopicChannel000000000a"
+    assert [link["url"] for link in result["links"]] == [
+        playlist_url("OLAK5uy_albumOne0000000000000000000000000"),
+        playlist_url("OLAK5uy_albumLockup000000000000000000000000"),
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        playlist_url("OLAK5uy_epFromWatch000000000000000000000000"),
+        playlist_url("OLAK5uy_albumTwo0000000000000000000000000"),
+        playlist_url("OLAK5uy_albumThree00000000000000000000000"),
+    ]
+    by_url = {link["url"]: link for link in result["links"]}
+    assert by_url[playlist_url("OLAK5uy_albumTwo0000000000000000000000000")]["track_count"] == 5
+
+    get, shelf, continuation = youtube.requests
+    assert "SOCS=" in get["headers"]["Cookie"]
+    for post in (shelf, continuation):
+        assert post["path"] == "/youtubei/v1/browse?prettyPrint=false&key=fixture-key"
+        assert post["body"]["context"]["client"]["clientVersion"] == "2.20240101.00.00"
+    assert shelf["body"]["browseId"] == "UCtopicChannel000000000a"
+    assert continuation["body"]["continuation"] == CONTINUATION
+
+def test_discover_channel_keeps_page_items_when_browse_fails(youtube):
+    youtube.on_post = None
+    result = discover_channel(youtube.base_url + CHANNEL_PATH)
+    assert len(result["links"]) == 4
+    assert [r["method"] for r in youtube.requests] == ["GET", "POST"]
+
+def test_discover_channel_without_initial_data(youtube):
+    youtube.routes["/consent"] = "<html><body><form action='https://consent.youtube.com/save'></form></body></html>"
+    with pytest.raises(ValueError):
+        discover_channel(youtube.base_url + "/consent")
@@ -0,0 +1,109 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+main = pytest.importorskip("main")
+from engine import unavailable_entries  # noqa: E402
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(main.METRICS, "log_path", None)
+    monkeypatch.setattr(main.TRACK_INDEX, "path", str(tmp_path / "library.sqlite"))
+    monkeypatch.setattr(main.TRACK_INDEX, "_db", None)
+    monkeypatch.setattr(main.STAGING, "path", str(tmp_path / "staging"))
+    song = tmp_path / "library" / "Single" / "Song.mp3"
+    song.parent.mkdir(parents=True)
+    song.write_bytes(b"audio" * 1000)
+    main.TRACK_INDEX.add(VIDEO_ID, str(song))
+    return tmp_path
+
+def entry(video_id=VIDEO_ID):
+    return {"id": video_id, "ie_key": "Youtube", "url": f"https://www.youtube.com/watch?v={video_id}"}
+
+def test_library_tracks_skips_what_the_release_already_has(library):
+    archive = library / "archive.txt"
+    assert main.library_tracks([entry(), entry("aaaaaaaaaaa")], str(archive)) == {VIDEO_ID}
+    archive.write_text(f"youtube {VIDEO_ID}\n")
+    assert main.library_tracks([entry()], str(archive)) == set()
+
+def test_reused_tracks_are_linked_into_the_library_not_staged(library, monkeypatch):
+    target = str(library / "library" / "Album")
+    staged = []
+
+    def download(url, output_dir, browser, cookies=True, **options):
+        assert options["skip_ids"] == {VIDEO_ID}
+        staged.extend(os.listdir(main.STAGING.folder(target)))
+        return {"url": url, "ok": True, "errors": [], "bytes": 0, "files": []}
+
+    monkeypatch.setattr(main.ENGINE, "download", download)
+    finished = []
+    main.fetch_tracks("https://www.youtube.com/playlist?list=album", target, "none", False,
+                      on_complete=finished.append, owns_folder=True, reuse={VIDEO_ID})
+    main.TRANSCODER.wait()
+    assert staged == []
+    assert finished[0]["ok"]
+    assert os.path.samefile(os.path.join(target, "Song.mp3"), library / "library" / "Single" / "Song.mp3")
+    assert not os.path.exists(main.STAGING.folder(target))
+
+def transcoded(track, dest_dir):
+    # Stands in for the transcode pool: the "mp3" is ready at once
+    dest = os.path.join(dest_dir, f"{track['title']}.mp3")
+    with open(dest, "wb") as f:
+        f.write(b"mp3" * 100)
+    future = Future()
+    future.set_result({"ok": True, "src": track["filepath"], "dest": dest, "error": None})
+    return future
+
+def fetch_release(target, download, monkeypatch):
+    monkeypatch.setattr(main.ENGINE, "download", download)
+    finished = []
+    main.fetch_tracks("https://www.youtube.com/playlist?list=album", target, "none", False,
+                      archive=os.path.join(target, main.ARCHIVE_NAME), on_complete=finished.append,
+                      cover="cover.jpg", owns_folder=True)
+    main.TRANSCODER.wait()
+    return finished[0]
+
+def test_failed_release_keeps_its_staged_tracks_for_the_next_attempt(library, monkeypatch):
+    target = str(library / "library" / "Album")
+    track = {"id": "aaaaaaaaaaa", "title": "First", "archive_id": "youtube aaaaaaaaaaa", "filepath": "First.m4a",
+             "metadata": {}, "thumbnails": []}
+    monkeypatch.setattr(main.TRANSCODER, "submit", lambda src, dest_dir, *args: transcoded(track, dest_dir))
+
+    def interrupted(url, output_dir, browser, cookies=True, on_file=None, **options):
+        on_file(track)
+        raise ConnectionResetError("connection reset by peer")
+
+    with pytest.raises(ConnectionResetError):
+        fetch_release(target, interrupted, monkeypatch)
+    main.TRANSCODER.wait()
+    assert not os.path.exists(target)
+    assert [t["id"] for t in main.STAGING.staged(target)] == ["aaaaaaaaaaa"]
+
+    def resumed(url, output_dir, browser, cookies=True, on_file=None, **options):
+        assert options["skip_ids"] == {"aaaaaaaaaaa"}
+        return {"url": url, "ok": True, "errors": [], "bytes": 0, "files": []}
+
+    final = fetch_release(target, resumed, monkeypatch)
+    assert final["ok"]
+    assert [os.path.basename(t["filepath"]) for t in final["files"]] == ["First.mp3"]
+    assert os.path.isfile(os.path.join(target, "First.mp3"))
+    assert main.load_archive(os.path.join(target, main.ARCHIVE_NAME)) == {"youtube aaaaaaaaaaa"}
+    assert not os.path.exists(main.STAGING.folder(target))
+    assert not os.path.exists(main.STAGING.downloads(target))
+
+def test_unavailable_tracks_do_not_keep_the_release_unfinished(library, monkeypatch):
+    target = str(library / "library" / "Album")
+    gone = "ERROR: [youtube] ccccccccccc: Video unavailable. This video has been removed by the uploader"
+    throttled = "ERROR: [youtube] ddddddddddd: HTTP Error 429: Too Many Requests"
+    assert unavailable_entries([gone, throttled, "ERROR: Postprocessing: Conversion failed"]) == {"youtube ccccccccccc": gone}
+
+    def download(url, output_dir, browser, cookies=True, **options):
+        return {"url": url, "ok": False, "errors": [gone], "bytes": 0, "files": []}
+
+    final = fetch_release(target, download, monkeypatch)
+    assert final["ok"] and final["errors"] == []
+    assert final["unavailable"] == ["youtube ccccccccccc"]
+    assert main.load_archive(os.path.join(target, main.ARCHIVE_NAME)) == {"youtube ccccccccccc"}
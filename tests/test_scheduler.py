@@ -0,0 +1,55 @@
+import threading
+import time
+
+from scheduler import DownloadScheduler, TokenBucket, parse_rate
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def test_parse_rate():
+    assert parse_rate("10M") == 10 * 1024 ** 2
+    assert parse_rate("512k") == 512 * 1024
+    assert parse_rate(None) == 0
+
+def test_token_bucket_holds_callers_to_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(1000, clock=clock, sleep=clock.sleep)
+    for _ in range(20):
+        bucket.consume(500)
+    # 10 000 bytes at 1000 B/s, less the quarter second of starting credit
+    assert clock.now == 9.75
+    assert TokenBucket(0).consume(10 ** 9) == 0.0
+
+def test_budget_is_shared_by_concurrent_downloads():
+    bucket = TokenBucket(parse_rate("4M"))
+    chunk = 64 * 1024
+
+    def download():
+        for _ in range(16):
+            bucket.consume(chunk)
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=download) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 5 MiB through a 4 MiB/s budget, however many downloads share it
+    assert time.monotonic() - start >= 0.95
+
+def test_connections_stay_inside_the_budget_at_full_parallelism():
+    scheduler = DownloadScheduler(max_jobs=5, max_connections=40, total_rate="10M")
+    limits = scheduler.current_limits()
+    assert limits["fragments"] * scheduler.max_jobs <= 40
+    assert limits["bandwidth"] is scheduler.bandwidth
+    scheduler.shutdown()
+    scheduler = DownloadScheduler(max_jobs=3, max_connections=10)
+    assert scheduler.current_limits()["fragments"] == 3
+    scheduler.shutdown()
@@ -0,0 +1,164 @@
+import shutil
+import threading
+
+import pytest
+
+pytest.importorskip("selenium")
+from selenium.common.exceptions import WebDriverException
+
+from conftest import read_fixture
+from scraper import MAX_SCROLLS, ScraperPool, accept_consent, filter_links, firefox_driver, scroll_until_stable, wait_for_idle
+
+needs_firefox = pytest.mark.skipif(not (shutil.which("geckodriver") and shutil.which("firefox")),
+                                   reason="needs Firefox and geckodriver")
+
+class FakeDriver:
+    def __init__(self, number):
+        self.number = number
+        self.quit_called = False
+
+    def execute_script(self, script, *args):
+        return None
+
+    def quit(self):
+        self.quit_called = True
+
+class FakeFactory:
+    def __init__(self, fail=0):
+        self.drivers = []
+        self.fail = fail
+
+    def __call__(self):
+        if self.fail:
+            self.fail -= 1
+            raise WebDriverException("browser did not start")
+        driver = FakeDriver(len(self.drivers) + 1)
+        self.drivers.append(driver)
+        return driver
+
+@pytest.fixture
+def pages(http_stand_in):
+    for name in ("consent.html", "shelf.html"):
+        http_stand_in.routes["/" + name] = read_fixture("scraper", name)
+    return http_stand_in
+
+@pytest.fixture
+def firefox():
+    driver = firefox_driver()
+    yield driver
+    driver.quit()
+
+def test_filter_links_dedupes_and_folds_watch_links_into_playlists():
+    links = filter_links([
+        "https://www.youtube.com/playlist?list=OLAK5uy_albumOne00000000",
+        "https://www.youtube.com/playlist?list=OLAK5uy_albumOne00000000",
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=OLAK5uy_albumTwo00000000",
+        "https://www.youtube.com/watch?v=aaaaaaaaaa1&list=OLAK5uy_albumTwo00000000",
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "https://www.youtube.com/watch?v=short",
+        "https://www.youtube.com/playlist?list=short",
+    ])
+    assert links == [
+        {"url": "https://www.youtube.com/playlist?list=OLAK5uy_albumOne00000000", "title": "Unknown"},
+        {"url": "https://www.youtube.com/playlist?list=OLAK5uy_albumTwo00000000", "title": "Unknown"},
+        {"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "title": "Unknown"},
+    ]
+
+def test_pool_reuses_healthy_sessions():
+    factory = FakeFactory()
+    pool = ScraperPool(2, driver_factory=factory, warmup_url=None)
+    with pool.session() as first:
+        pass
+    with pytest.raises(ValueError):
+        with pool.session() as second:
+            raise ValueError("not the browser's fault")
+    with pool.session() as third:
+        pass
+    assert first is second is third
+    assert len(factory.drivers) == 1
+    pool.close()
+    assert first.quit_called
+
+def test_pool_discards_sessions_on_webdriver_errors():
+    factory = FakeFactory()
+    pool = ScraperPool(1, driver_factory=factory, warmup_url=None)
+    with pytest.raises(WebDriverException):
+        with pool.session() as broken:
+            raise WebDriverException("browser crashed")
+    assert broken.quit_called
+    # The discarded session frees its slot, so a size-1 pool does not block here
+    with pool.session() as fresh:
+        pass
+    assert fresh is not broken
+    assert len(factory.drivers) == 2
+    pool.close()
+
+def test_pool_recovers_from_a_failed_start():
+    factory = FakeFactory(fail=1)
+    pool = ScraperPool(1, driver_factory=factory, warmup_url=None)
+    with pytest.raises(WebDriverException):
+        with pool.session():
+            pass
+    with pool.session() as driver:
+        assert driver.number == 1
+    pool.close()
+
+def test_pool_never_opens_more_than_size_sessions():
+    factory = FakeFactory()
+    pool = ScraperPool(2, driver_factory=factory, warmup_url=None)
+    inside = threading.Semaphore(0)
+    leave = threading.Event()
+    seen = []
+
+    def scrape():
+        with pool.session() as driver:
+            seen.append(driver)
+            inside.release()
+            leave.wait(5)
+
+    threads = [threading.Thread(target=scrape) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert inside.acquire(timeout=5) and inside.acquire(timeout=5)
+    # Two sessions are busy, the other two callers wait for one of them
+    assert not inside.acquire(timeout=0.3)
+    leave.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(seen) == 4
+    assert len(factory.drivers) == 2
+    pool.close()
+
+@needs_firefox
+def test_wait_for_idle_waits_until_the_page_stops_growing(pages, firefox):
+    # Six more batches arrive 150 ms apart after load
+    firefox.get(pages.base_url + "/shelf.html?timer=6&total=100")
+    state = wait_for_idle(firefox, idle=0.4, timeout=5)
+    assert state["links"] == 56
+
+@needs_firefox
+def test_scroll_until_stable_stops_when_the_shelf_is_complete(pages, firefox):
+    firefox.get(pages.base_url + "/shelf.html?total=40")
+    assert scroll_until_stable(firefox) == 40
+    # One scroll per batch plus the one that found nothing new
+    assert firefox.execute_script("return window.scrolls") < MAX_SCROLLS
+
+@needs_firefox
+def test_accept_consent(pages, firefox):
+    firefox.get(pages.base_url + "/shelf.html")
+    assert not accept_consent(firefox)
+    firefox.get(pages.base_url + "/consent.html")
+    assert accept_consent(firefox, timeout=5)
+    assert firefox.current_url.startswith(pages.base_url + "/shelf.html")
+
+@needs_firefox
+def test_warm_pool_scrapes_a_shelf(pages):
+    pool = ScraperPool(1, warmup_url=pages.base_url + "/consent.html")
+    try:
+        result = pool.scrape(pages.base_url + "/shelf.html?total=24")
+        assert len(result["links"]) == 24
+        assert "channel_name" not in result
+        with pool.session() as driver:
+            assert "SOCS=CAI" in driver.execute_script("return document.cookie")
+    finally:
+        pool.close()
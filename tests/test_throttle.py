@@ -0,0 +1,78 @@
+import shutil
+
+import pytest
+
+from benchmark import FakeYouTube, FakeYoutubeIE
+from engine import YtDlpEngine
+from scheduler import MAX_THROTTLE_RETRIES, DownloadScheduler
+from throttle import MIN_SAMPLE_BYTES, AdaptiveLimiter
+
+pytestmark = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="the fake backend makes its samples with ffmpeg")
+
+@pytest.fixture(scope="module")
+def backend():
+    # Slow enough per connection that a healthy track takes a measurable time
+    fake = FakeYouTube(artists=1, releases=1, tracks=4, track_seconds=120, latency=0, bandwidth=8 * 1024 * 1024).start()
+    yield fake
+    fake.stop()
+
+@pytest.fixture
+def engine():
+    return YtDlpEngine(pool_size=2, extractors=[FakeYoutubeIE])
+
+def limiter(limit=4):
+    return AdaptiveLimiter(limit, increase_after=2, base_delay=0.01, max_delay=0.05)
+
+def album(backend):
+    return f"{backend.base_url}/playlist?list={backend.release_id(0, 0)}"
+
+def download(engine, backend, folder, **options):
+    return engine.download(album(backend), str(folder), "none", cookies=False, playlist=True, **options)
+
+def test_download_reports_time_spent_receiving(engine, backend, tmp_path):
+    backend.error_rate = 0
+    result = download(engine, backend, tmp_path)
+    assert result["ok"] and result["skipped"] == 0
+    assert result["bytes"] == 4 * len(backend.audio)
+    assert 0 < result["download_seconds"]
+
+def test_incremental_release_is_not_a_throughput_collapse(engine, backend, tmp_path):
+    backend.error_rate = 0
+    limits = limiter()
+    full = download(engine, backend, tmp_path / "full")
+    assert limits.record(full["ok"], full["errors"], full["bytes"], full["download_seconds"], full["skipped"]) == "ok"
+    # Three of four tracks are already in the library, one is fetched
+    track_ids = [backend.video_id("v", 0, 0, t) for t in range(4)]
+    partial = download(engine, backend, tmp_path / "partial", skip_ids=set(track_ids[1:]))
+    assert partial["ok"] and partial["skipped"] == 3 and len(partial["files"]) == 1
+    status = limits.record(partial["ok"], partial["errors"], partial["bytes"], partial["download_seconds"], partial["skipped"])
+    assert status == "ok"
+    assert limits.limit == 4
+
+def test_small_or_slow_samples():
+    limits = limiter()
+    assert limits.record(True, nbytes=8 * MIN_SAMPLE_BYTES, seconds=1.0) == "ok"
+    # A tiny job taking a while is latency, not a collapse
+    assert limits.record(True, nbytes=1000, seconds=5.0) == "ok"
+    assert limits.record(True, nbytes=8 * MIN_SAMPLE_BYTES, seconds=100.0) == "slow"
+    assert limits.limit == 2
+
+def test_scheduler_backs_off_and_recovers_against_injected_429s(engine, backend, tmp_path):
+    scheduler = DownloadScheduler(max_jobs=4, limiter=limiter())
+    try:
+        backend.error_rate = 1.0
+        throttled, = scheduler.wait([scheduler.submit("album", download, engine, backend, tmp_path / "throttled")])
+        assert not throttled["ok"]
+        assert throttled["status"] == "throttled"
+        assert throttled["attempts"] == MAX_THROTTLE_RETRIES + 1
+        assert scheduler.limiter.limit == 1
+        assert "HTTP Error 429" in throttled["errors"][-1]
+
+        backend.error_rate = 0
+        healthy = scheduler.wait([scheduler.submit(f"album {n}", download, engine, backend, tmp_path / f"healthy{n}")
+                                  for n in range(6)])
+        assert all(outcome["ok"] and outcome["attempts"] == 1 for outcome in healthy)
+        assert scheduler.limiter.limit == 4
+    finally:
+        backend.error_rate = 0
+        scheduler.shutdown()
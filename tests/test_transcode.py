@@ -0,0 +1,32 @@
+import threading
+
+from transcode import Transcoder
+
+def test_finalize_callbacks_do_not_hold_up_other_results(tmp_path):
+    # Sources that do not exist fail at once, all that matters here is when callbacks run
+    transcoder = Transcoder(workers=1, mode="native")
+    slow_started = threading.Event()
+    release = threading.Event()
+    fast_done = threading.Event()
+
+    def slow_finalize():
+        slow_started.set()
+        release.wait(10)
+
+    try:
+        transcoder.after([transcoder.submit(str(tmp_path / "first.webm"), str(tmp_path))], slow_finalize)
+        assert slow_started.wait(10)
+        transcoder.after([transcoder.submit(str(tmp_path / "second.webm"), str(tmp_path))], fast_done.set)
+        assert fast_done.wait(3)
+    finally:
+        release.set()
+        transcoder.shutdown()
+    assert len(transcoder.failed) == 2
+
+def test_after_without_futures_still_runs_the_callback():
+    transcoder = Transcoder(workers=1)
+    done = threading.Event()
+    transcoder.after([], done.set)
+    transcoder.wait()
+    assert done.is_set()
+    transcoder.shutdown()
@@ -0,0 +1,138 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from scheduler import DownloadScheduler
+from throttle import AdaptiveLimiter
+from workqueue import DONE, PENDING, RUNNING, WorkQueue
+
+# Workers run in separate processes on the queue file, the way several
+# `main.py worker` processes share one box
+CONTEXT = multiprocessing.get_context("spawn")
+
+def drain(path, worker, claimed):
+    queue = WorkQueue(path)
+    queue.attach()
+    while True:
+        tasks = queue.claim(3, worker=worker, lease=30)
+        if not tasks:
+            break
+        for task in tasks:
+            claimed.put((worker, task["url"]))
+            assert queue.finish(task, True, result={"worker": worker})
+    queue.close()
+
+def hold_past_lease(path, claimed, reclaimed, finished):
+    # Claims one task, then stalls without heartbeats until another worker has it
+    queue = WorkQueue(path)
+    queue.attach()
+    task, = queue.claim(1, worker="slow", lease=0.5)
+    claimed.set()
+    reclaimed.wait(30)
+    finished.put(queue.finish(task, False, "late result", {"worker": "slow"}))
+    queue.close()
+
+def heartbeat_for(path, seconds, claimed):
+    queue = WorkQueue(path)
+    queue.attach()
+    queue.claim(1, worker="steady", lease=0.5)
+    claimed.set()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        queue.heartbeat("steady", lease=0.5)
+        time.sleep(0.1)
+    queue.close()
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "queue.sqlite")
+
+def start(target, *args):
+    process = CONTEXT.Process(target=target, args=args)
+    process.start()
+    return process
+
+def test_top_level_tasks_are_queued_once(queue_path):
+    queue = WorkQueue(queue_path)
+    assert queue.start_run(["a", "b", "a"], "artist", [("playlist", "p"), ("playlist", "p")])
+    queue.add("artist", "b")
+    assert queue.counts() == {("artist", PENDING): 2, ("playlist", PENDING): 1}
+    queue.close()
+
+def test_workers_in_several_processes_claim_each_task_once(queue_path):
+    queue = WorkQueue(queue_path)
+    urls = [f"release-{n}" for n in range(60)]
+    queue.start_run(urls, "release")
+    claimed = CONTEXT.Queue()
+    workers = [start(drain, queue_path, f"worker-{n}", claimed) for n in range(4)]
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    seen = [claimed.get(timeout=5) for _ in urls]
+    assert sorted(url for _, url in seen) == sorted(urls)
+    assert queue.counts() == {("release", DONE): 60}
+    assert not queue.unfinished()
+    queue.close()
+
+def test_expired_lease_moves_the_task_and_drops_the_late_result(queue_path):
+    queue = WorkQueue(queue_path)
+    queue.start_run(["release"], "release")
+    claimed, reclaimed, finished = CONTEXT.Event(), CONTEXT.Event(), CONTEXT.Queue()
+    slow = start(hold_past_lease, queue_path, claimed, reclaimed, finished)
+    assert claimed.wait(30)
+    assert queue.reclaim_expired() == 0
+    time.sleep(0.7)
+    assert queue.reclaim_expired() == 1
+    task, = queue.claim(1, worker="fast", lease=30)
+    reclaimed.set()
+    assert finished.get(timeout=30) is False
+    slow.join(30)
+    assert queue.finish(task, True, result={"worker": "fast"})
+    done, = queue.unmerged(("release",))
+    assert done["status"] == DONE and done["result"] == {"worker": "fast"}
+    # The slow worker lost the task for good, even once it is finished
+    assert not queue.finish(dict(task, worker="slow"), False, "late result")
+    queue.close()
+
+def test_heartbeats_keep_the_lease(queue_path):
+    queue = WorkQueue(queue_path)
+    queue.start_run(["release"], "release")
+    claimed = CONTEXT.Event()
+    steady = start(heartbeat_for, queue_path, 1.5, claimed)
+    assert claimed.wait(30)
+    time.sleep(1.0)
+    assert queue.reclaim_expired() == 0
+    assert queue.counts() == {("release", RUNNING): 1}
+    steady.join(30)
+    queue.close()
+
+def test_throttled_attempts_leave_the_task_running_until_the_last(queue_path, monkeypatch):
+    main = pytest.importorskip("main")
+    scheduler = DownloadScheduler(1, limiter=AdaptiveLimiter(1, base_delay=0.01, max_delay=0.02))
+    monkeypatch.setattr(main, "SCHEDULER", scheduler)
+    monkeypatch.setattr(main.METRICS, "log_path", None)
+    queue = WorkQueue(queue_path)
+    queue.start_run(["release"], "release")
+    statuses, finished, callbacks = [], [], []
+
+    def handler(task, attempt):
+        statuses.append(queue.counts())
+        ok = attempt.number == 2
+        error = None if ok else "ERROR: HTTP Error 429: Too Many Requests"
+        # The result arrives later from another thread, as for a transcoded release
+        callback = threading.Thread(target=lambda: finished.append(attempt.finish(ok, error)))
+        callback.start()
+        callbacks.append(callback)
+        return {"url": task["url"], "ok": ok, "errors": [error] if error else []}
+
+    main.process_queue(queue, {"release": handler}, worker="w1", lease=30)
+    for callback in callbacks:
+        callback.join(5)
+    # A coordinator polling meanwhile sees the task as unfinished the whole time
+    assert statuses == [{("release", RUNNING): 1}] * 3
+    assert sorted(finished) == [False, False, True]
+    assert queue.counts() == {("release", DONE): 1}
+    scheduler.shutdown()
+    queue.close()
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.request
+from discovery import USER_AGENT
+
+ARTWORK_SIZE = 600
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+MAX_CANDIDATES = 4
+TIMEOUT = 20
+# Fetches of the same URL wait for each other; a fixed set of locks keeps that
+# bounded however many URLs a long sync goes through
+URL_LOCK_STRIPES = 64
+
+def thumbnail_urls(info, limit=MAX_CANDIDATES):
+    thumbnails = [t for t in (info or {}).get("thumbnails") or [] if t.get("url")]
+    thumbnails.sort(key=lambda t: (t.get("preference") or 0, t.get("width") or 0), reverse=True)
+    urls = [t["url"] for t in thumbnails]
+    if (info or {}).get("thumbnail") and info["thumbnail"] not in urls:
+        urls.insert(0, info["thumbnail"])
+    return urls[:limit]
+
+def normalize_image(data, dest, size=ARTWORK_SIZE):
+    tmp = dest + ".part"
+    # Centre crop to a square (video thumbnails letterbox the cover) and
+    # re-encode once, so every track can embed the bytes as they are
+    vf = f"crop='min(iw,ih)':'min(iw,ih)',scale={size}:{size}:flags=lanczos"
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-i", "pipe:0", "-vf", vf, "-frames:v", "1", "-q:v", "2", "-f", "mjpeg", tmp],
+        input=data, check=True, capture_output=True,
+    )
+    os.replace(tmp, dest)
+
+class ArtworkCache:
+    def __init__(self, path, size=ARTWORK_SIZE, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.size = size
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._url_locks = [threading.Lock() for _ in range(URL_LOCK_STRIPES)]
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.path, "index.sqlite"), check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, hash TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS images (hash TEXT PRIMARY KEY, size INTEGER, last_access REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS images_access ON images (last_access)")
+        return self._db
+
+    def _file(self, digest):
+        return os.path.join(self.path, f"{digest}.jpg")
+
+    def _lookup(self, url):
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT hash FROM urls WHERE url = ?", (url,)).fetchone()
+            if not row or not os.path.exists(self._file(row[0])):
+                return None
+            db.execute("UPDATE images SET last_access = ? WHERE hash = ?", (time.time(), row[0]))
+            db.commit()
+            return self._file(row[0])
+
+    def _url_lock(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).digest()
+        return self._url_locks[int.from_bytes(digest[:4], "big") % len(self._url_locks)]
+
+    def _fetch(self, url):
+        req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+            data = resp.read()
+        # Same image behind different URLs is stored once
+        digest = hashlib.sha1(data).hexdigest()
+        dest = self._file(digest)
+        if not os.path.exists(dest):
+            normalize_image(data, dest, self.size)
+        with self._lock:
+            db = self._conn()
+            db.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (url, digest))
+            db.execute(
+                "INSERT OR REPLACE INTO images (hash, size, last_access) VALUES (?, ?, ?)",
+                (digest, os.path.getsize(dest), time.time()),
+            )
+            self._evict(db, keep=digest)
+            db.commit()
+        return dest
+
+    def get(self, urls):
+        if isinstance(urls, str):
+            urls = [urls]
+        urls = [url for url in urls or [] if url]
+        for url in urls:
+            path = self._lookup(url)
+            if path:
+                return path
+        for url in urls:
+            with self._url_lock(url):
+                # Another job may have fetched it while we waited
+                path = self._lookup(url)
+                if path:
+                    return path
+                try:
+                    path = self._fetch(url)
+                except Exception:
+                    continue
+            return path
+        return None
+
+    def _evict(self, db, keep=None):
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = db.execute("SELECT hash, size FROM images ORDER BY last_access").fetchall()
+        for digest, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            db.execute("DELETE FROM images WHERE hash = ?", (digest,))
+            db.execute("DELETE FROM urls WHERE hash = ?", (digest,))
+            try:
+                os.remove(self._file(digest))
+            except OSError:
+                pass
+            count -= 1
+            total -= size
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,303 @@
+import json
+import os
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from yt_dlp.extractor.common import InfoExtractor
+
+CHUNK_SIZE = 64 * 1024
+
+class FakeYoutubeIE(InfoExtractor):
+    # Stand-in for the YouTube extractors: the fake server answers every page
+    # with the info dict yt-dlp would have built from the real one
+    IE_NAME = "fakeyoutube"
+    _VALID_URL = r"https?://(?:127\.0\.0\.1|localhost):\d+/"
+
+    def _real_extract(self, url):
+        return self._download_json(url, self._generic_id(url), note=False, errnote="Fake YouTube request failed")
+
+def make_sample(args, suffix):
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error"] + args + [path], check=True, capture_output=True)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+class FakeYouTube:
+    def __init__(self, artists=2, releases=3, tracks=4, playlist_tracks=8, track_seconds=30,
+                 latency=0.05, bandwidth=0, error_rate=0.0, seed=0):
+        self.artists = artists
+        self.releases = releases
+        self.tracks = tracks
+        self.playlist_tracks = playlist_tracks
+        self.track_seconds = track_seconds
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "bytes": 0, "errors": 0, "media": 0}
+        self.audio = None
+        self.cover = None
+        self._httpd = None
+
+    def config(self):
+        return {
+            "artists": self.artists, "releases": self.releases, "tracks": self.tracks,
+            "playlist_tracks": self.playlist_tracks, "track_seconds": self.track_seconds,
+            "latency": self.latency, "bandwidth": self.bandwidth, "error_rate": self.error_rate,
+        }
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self.audio = make_sample(["-f", "lavfi", "-i", f"sine=frequency=440:duration={self.track_seconds}",
+                                  "-c:a", "aac", "-b:a", "128k", "-f", "ipod"], ".m4a")
+        self.cover = make_sample(["-f", "lavfi", "-i", "testsrc=size=1280x720", "-frames:v", "1", "-f", "mjpeg"], ".jpg")
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.backend = self
+        threading.Thread(target=self._httpd.serve_forever, name="fake-youtube", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def should_fail(self):
+        with self._lock:
+            return self.error_rate and self._rng.random() < self.error_rate
+
+    def channel_urls(self):
+        return [f"{self.base_url}/@artist{a}" for a in range(self.artists)]
+
+    def playlist_url(self):
+        return f"{self.base_url}/playlist?list=PLbenchmarkmix00"
+
+    def video_id(self, prefix, *numbers):
+        return (prefix + "".join(f"{n:03d}" for n in numbers)).ljust(11, "x")[:11]
+
+    def release_id(self, artist, release):
+        return f"OLAKbench{artist:03d}{release:03d}"
+
+    def video_entry(self, video_id, title):
+        return {"_type": "url", "url": f"{self.base_url}/watch?v={video_id}", "id": video_id, "title": title,
+                "duration": self.track_seconds}
+
+    def page(self, path, query):
+        if path.startswith("/@artist"):
+            artist = int(path.split("/")[1][len("@artist"):])
+            return {
+                "_type": "playlist", "id": f"UCbench{artist:03d}", "title": f"Artist {artist} - Releases",
+                "channel": f"Artist {artist}", "channel_id": f"UCbench{artist:03d}",
+                "entries": [
+                    {"_type": "url", "url": f"{self.base_url}/playlist?list={self.release_id(artist, r)}",
+                     "id": self.release_id(artist, r), "title": f"Album {artist}-{r}", "playlist_count": self.tracks}
+                    for r in range(self.releases)
+                ],
+            }
+        if path == "/playlist":
+            list_id = query.get("list", [""])[0]
+            if list_id == "PLbenchmarkmix00":
+                entries = [self.video_entry(self.video_id("p", t), f"Mix track {t}") for t in range(self.playlist_tracks)]
+                title = "Benchmark mix"
+            else:
+                artist, release = int(list_id[-6:-3]), int(list_id[-3:])
+                entries = [self.video_entry(self.video_id("v", artist, release, t), f"Track {t + 1}") for t in range(self.tracks)]
+                title = f"Album {artist}-{release}"
+            return {"_type": "playlist", "id": list_id, "title": title, "entries": entries,
+                    "thumbnails": [{"url": f"{self.base_url}/cover/{list_id}.jpg", "width": 1280}]}
+        if path == "/watch":
+            video_id = query.get("v", [""])[0]
+            return {
+                "id": video_id, "title": f"Track {video_id}", "duration": self.track_seconds,
+                "artist": "Benchmark", "album": "Benchmark", "webpage_url": f"{self.base_url}/watch?v={video_id}",
+                "thumbnails": [{"url": f"{self.base_url}/cover/{video_id}.jpg", "width": 1280}],
+                "formats": [{"format_id": "140", "url": f"{self.base_url}/media/{video_id}.m4a", "ext": "m4a",
+                             "acodec": "mp4a.40.2", "vcodec": "none", "filesize": len(self.audio), "abr": 128}],
+            }
+        return None
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        backend = self.server.backend
+        backend.count("requests")
+        if backend.latency:
+            time.sleep(backend.latency)
+        parts = urllib.parse.urlsplit(self.path)
+        if backend.should_fail():
+            backend.count("errors")
+            self.send_error(429, "Too Many Requests")
+            return
+        if parts.path.startswith("/media/"):
+            backend.count("media")
+            self.send_body(backend.audio, "audio/mp4", backend.bandwidth)
+        elif parts.path.startswith("/cover/"):
+            self.send_body(backend.cover, "image/jpeg")
+        else:
+            data = backend.page(parts.path, urllib.parse.parse_qs(parts.query))
+            if data is None:
+                self.send_error(404)
+                return
+            self.send_body(json.dumps(data).encode("utf-8"), "application/json")
+
+    def send_body(self, body, content_type, bandwidth=0):
+        backend = self.server.backend
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        start = time.monotonic()
+        sent = 0
+        try:
+            while sent < len(body):
+                chunk = body[sent:sent + CHUNK_SIZE]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if bandwidth:
+                    # Per-connection cap, like a throttled CDN edge
+                    ahead = sent / bandwidth - (time.monotonic() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        backend.count("bytes", sent)
+
+def descendants(pid):
+    found = []
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            tasks = os.listdir(f"/proc/{current}/task")
+        except OSError:
+            continue
+        for tid in tasks:
+            try:
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    children = [int(c) for c in f.read().split()]
+            except OSError:
+                continue
+            found.extend(children)
+            stack.extend(children)
+    return found
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+class ResourceSampler:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_processes = 0
+        self.peak_threads = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        pid = os.getpid()
+        children = descendants(pid)
+        self.peak_rss = max(self.peak_rss, rss_bytes(pid) + sum(rss_bytes(c) for c in children))
+        self.peak_processes = max(self.peak_processes, len(children))
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        if not self.peak_rss:
+            # No /proc (not Linux): fall back to the kernel's own high-water mark
+            self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return False
+
+def measure(backend, fn, *args):
+    before = backend.snapshot()
+    start = time.monotonic()
+    with ResourceSampler() as sampler:
+        fn(*args)
+    wall = time.monotonic() - start
+    after = backend.snapshot()
+    served = {k: after[k] - before[k] for k in after}
+    return {
+        "wall": round(wall, 3),
+        "requests": served["requests"],
+        "media": served["media"],
+        "errors_injected": served["errors"],
+        "bytes": served["bytes"],
+        "throughput": round(served["bytes"] / wall, 1) if wall else 0,
+        "tracks_per_s": round(served["media"] / wall, 3) if wall else 0,
+        "peak_rss": sampler.peak_rss,
+        "peak_processes": sampler.peak_processes,
+        "peak_threads": sampler.peak_threads,
+    }
+
+def code_version(path):
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=path, capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def load_results(path):
+    results = []
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return results
+
+def previous_result(path, config):
+    for result in reversed(load_results(path)):
+        if result.get("config") == config:
+            return result
+    return None
+
+def save_result(path, result):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(result) + "\n")
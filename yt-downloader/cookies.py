@@ -0,0 +1,79 @@
+import os
+import re
+import threading
+from yt_dlp.cookies import extract_cookies_from_browser
+from metrics import METRICS
+from throttle import is_throttle_error
+
+AUTH_ERROR_PATTERNS = [
+    r"sign in to confirm your age",
+    r"cookies are no longer valid",
+    r"login required",
+    r"use --cookies",
+    r"private video",
+    r"members[- ]only",
+    r"HTTP Error 401",
+]
+AUTH_ERROR_RE = re.compile("|".join(AUTH_ERROR_PATTERNS), re.IGNORECASE)
+
+def is_auth_error(messages):
+    # Bot checks also say "use --cookies", but they are throttling and are left
+    # to the scheduler's backoff, reloading the same cookies does not help. A bare
+    # 403 is no sign of it either: googlevideo answers it for expired or throttled
+    # media URLs
+    return any(AUTH_ERROR_RE.search(msg) and not is_throttle_error([msg]) for msg in messages)
+
+class QuietLogger:
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        print(msg)
+
+class CookieSession:
+    def __init__(self, browser, cache_dir):
+        self.browser = browser
+        self.path = os.path.join(cache_dir, f"cookies-{browser}.txt")
+        self.generation = 0
+        self.loaded = False
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with METRICS.timed("cookies", browser=self.browser, generation=self.generation + 1) as span:
+            try:
+                jar = extract_cookies_from_browser(self.browser, logger=QuietLogger())
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                os.close(fd)
+                jar.save(self.path)
+                self.failed = False
+                span["cookies"] = len(jar)
+                print(f"🍪 Loaded {len(jar)} cookies from {self.browser}")
+            except Exception as e:
+                self.failed = True
+                span.update(ok=False, error=str(e))
+                print(f"⚠️ Could not load cookies from {self.browser}: {e}")
+        self.loaded = True
+        self.generation += 1
+
+    def cookie_file(self):
+        with self._lock:
+            if not self.loaded:
+                self._load()
+            return None if self.failed else self.path
+
+    def refresh(self, seen_generation):
+        with self._lock:
+            # Another worker may already have refreshed after the same failure
+            if self.generation != seen_generation:
+                return False
+            print(f"♻️ Reloading cookies from {self.browser}...")
+            self._load()
+            return not self.failed
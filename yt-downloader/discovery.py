@@ -0,0 +1,239 @@
+import json
+import re
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, field
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+# Pre-answered consent cookie so the EU consent interstitial is never served
+CONSENT_COOKIE = "SOCS=CAI; CONSENT=YES+"
+MAX_CONTINUATIONS = 50
+MAX_SHELVES = 10
+TIMEOUT = 20
+
+@dataclass
+class ReleaseInfo:
+    url: str
+    title: str = "Unknown"
+    id: str = None
+    track_count: int = None
+    duration: float = None
+
+@dataclass
+class ChannelInfo:
+    url: str
+    name: str = None
+    id: str = None
+    source: str = None
+    releases: list = field(default_factory=list)
+
+def origin_of(url):
+    parts = urllib.parse.urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def http_request(url, payload=None):
+    headers = {"User-Agent": USER_AGENT, "Accept-Language": "en-US,en;q=0.9", "Cookie": CONSENT_COOKIE}
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(url, data=data, headers=headers)
+    with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+        return resp.read().decode("utf-8", errors="replace")
+
+def extract_json_after(html, marker):
+    idx = html.find(marker)
+    if idx < 0:
+        return None
+    start = html.find("{", idx + len(marker))
+    if start < 0:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(html, start)[0]
+    except ValueError:
+        return None
+
+def parse_page(html):
+    data = extract_json_after(html, "ytInitialData = ") or extract_json_after(html, 'ytInitialData"] = ')
+    config = {}
+    for m in re.finditer(r"ytcfg\.set\(\s*\{", html):
+        try:
+            config.update(json.JSONDecoder().raw_decode(html, m.end() - 1)[0])
+        except ValueError:
+            continue
+    return data, config
+
+def text_of(node):
+    if isinstance(node, str):
+        return node
+    if not isinstance(node, dict):
+        return None
+    if "simpleText" in node:
+        return node["simpleText"]
+    if "runs" in node:
+        return "".join(r.get("text", "") for r in node["runs"])
+    if "content" in node:
+        return node["content"]
+    return None
+
+def walk(node):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            yield current
+            stack.extend(reversed(list(current.values())))
+        elif isinstance(current, list):
+            stack.extend(reversed(current))
+
+def count_of(text):
+    m = re.search(r'(\d[\d,.]*)\s*(?:videos?|songs?|tracks?|brani|video)', text or "", re.IGNORECASE)
+    return int(re.sub(r'[,.]', '', m.group(1))) if m else None
+
+def seconds_of(text):
+    if not text or not re.fullmatch(r'\d+(?::\d{1,2}){0,2}', text.strip()):
+        return None
+    seconds = 0
+    for part in text.strip().split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def badge_count(node):
+    for child in walk(node):
+        for key in ("thumbnailBadgeViewModel", "thumbnailOverlayBadgeViewModel"):
+            if key in child:
+                count = count_of(child[key].get("text") or text_of(child[key].get("text")))
+                if count is not None:
+                    return count
+        if "text" in child and isinstance(child["text"], str):
+            count = count_of(child["text"])
+            if count is not None:
+                return count
+    return None
+
+def item(kind, item_id, title=None, count=None, duration=None):
+    return {"kind": kind, "id": item_id, "title": title, "count": count, "duration": duration}
+
+def collect(data):
+    items, continuations, shelves = [], [], []
+    for node in walk(data):
+        for key in ("gridPlaylistRenderer", "playlistRenderer", "compactPlaylistRenderer"):
+            if key in node and node[key].get("playlistId"):
+                r = node[key]
+                count = r.get("videoCount") or count_of(text_of(r.get("videoCountText")) or text_of(r.get("videoCountShortText")))
+                items.append(item("playlist", r["playlistId"], text_of(r.get("title")), int(count) if count else None))
+        for key in ("gridVideoRenderer", "videoRenderer", "compactVideoRenderer"):
+            if key in node and node[key].get("videoId"):
+                r = node[key]
+                endpoint = r.get("navigationEndpoint", {}).get("watchEndpoint", {})
+                if endpoint.get("playlistId"):
+                    items.append(item("playlist", endpoint["playlistId"]))
+                else:
+                    items.append(item("video", r["videoId"], text_of(r.get("title")), 1, seconds_of(text_of(r.get("lengthText")))))
+        lockup = node.get("lockupViewModel")
+        if lockup and lockup.get("contentId"):
+            title = text_of(lockup.get("metadata", {}).get("lockupMetadataViewModel", {}).get("title"))
+            if "PLAYLIST" in lockup.get("contentType", "") or "ALBUM" in lockup.get("contentType", ""):
+                items.append(item("playlist", lockup["contentId"], title, badge_count(lockup.get("contentImage", {}))))
+            elif "VIDEO" in lockup.get("contentType", ""):
+                items.append(item("video", lockup["contentId"], title, 1))
+        token = node.get("continuationCommand", {}).get("token")
+        if token:
+            continuations.append(token)
+        shelf = node.get("shelfRenderer")
+        if shelf:
+            browse = shelf.get("endpoint", {}).get("browseEndpoint") or {}
+            if browse.get("browseId") and browse.get("params"):
+                shelves.append({"browseId": browse["browseId"], "params": browse["params"]})
+    return items, continuations, shelves
+
+def channel_name_of(data):
+    meta = (data or {}).get("metadata", {}).get("channelMetadataRenderer", {})
+    name = meta.get("title")
+    if not name:
+        for node in walk((data or {}).get("header", {})):
+            if "dynamicTextViewModel" in node:
+                # pageHeaderViewModel keeps the name one level down
+                name = text_of(node["dynamicTextViewModel"].get("text"))
+            else:
+                name = text_of(node.get("title")) if "title" in node else None
+            if name:
+                break
+    return clean_channel_name(name)
+
+def clean_channel_name(name):
+    name = (name or "").strip()
+    if not name:
+        return None
+    name = re.sub(r' - Topic$', '', name)
+    return re.sub(r'[<>:"/\\|?*]', '_', name)
+
+def filter_items(items):
+    links = {}
+    for found in items:
+        if found["kind"] == "playlist" and len(found["id"]) > 10:
+            url = f"https://www.youtube.com/playlist?list={found['id']}"
+        elif found["kind"] == "video" and len(found["id"]) == 11:
+            url = f"https://www.youtube.com/watch?v={found['id']}"
+        else:
+            continue
+        link = links.setdefault(url, {"url": url, "title": "Unknown", "id": found["id"]})
+        if found["title"] and link["title"] == "Unknown":
+            link["title"] = found["title"]
+        for key, field_name in (("count", "track_count"), ("duration", "duration")):
+            if found[key] and not link.get(field_name):
+                link[field_name] = found[key]
+    return list(links.values())
+
+def discover_channel(channel_url, fetch=http_request):
+    html = fetch(channel_url)
+    data, config = parse_page(html)
+    if not data:
+        raise ValueError("ytInitialData not found in channel page")
+    api_key = config.get("INNERTUBE_API_KEY")
+    context = config.get("INNERTUBE_CONTEXT") or {
+        "client": {"clientName": "WEB", "clientVersion": config.get("INNERTUBE_CLIENT_VERSION", "2.20240101.00.00")}
+    }
+    browse_url = f"{origin_of(channel_url)}/youtubei/v1/browse?prettyPrint=false"
+    if api_key:
+        browse_url += f"&key={api_key}"
+
+    def browse(payload):
+        return json.loads(fetch(browse_url, dict(payload, context=context)))
+
+    items, continuations, shelves = collect(data)
+    seen_tokens = set()
+    seen_shelves = set()
+    requests = 0
+    while (continuations or shelves) and requests < MAX_CONTINUATIONS:
+        if shelves:
+            shelf = shelves.pop(0)
+            key = (shelf["browseId"], shelf["params"])
+            if key in seen_shelves or len(seen_shelves) >= MAX_SHELVES:
+                continue
+            seen_shelves.add(key)
+            payload = shelf
+        else:
+            token = continuations.pop(0)
+            if token in seen_tokens:
+                continue
+            seen_tokens.add(token)
+            payload = {"continuation": token}
+        requests += 1
+        try:
+            response = browse(payload)
+        except Exception as e:
+            print(f"⚠️ Browse request failed: {e}")
+            continue
+        new_items, new_continuations, new_shelves = collect(response)
+        items.extend(new_items)
+        continuations.extend(new_continuations)
+        shelves.extend(new_shelves)
+    result = {"links": filter_items(items)}
+    channel_name = channel_name_of(data)
+    if channel_name:
+        result["channel_name"] = channel_name
+    channel_id = (data.get("metadata", {}).get("channelMetadataRenderer", {}).get("externalId"))
+    if channel_id:
+        result["channel_id"] = channel_id
+    return result
@@ -0,0 +1,411 @@
+import copy
+import json
+import queue
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+import yt_dlp
+from yt_dlp.postprocessor.common import PostProcessor
+from artwork import thumbnail_urls
+from cookies import CookieSession, is_auth_error
+from metrics import METRICS
+from throttle import is_throttle_error
+
+EXTRACTOR_ARGS = ["--extractor-args", "youtube:player-client=default,-tv_simply"]
+EXTRACT_ARGS = ["--flat-playlist", "--simulate", "--quiet", "--no-warnings"] + EXTRACTOR_ARGS
+# Download stage only: keep the source audio, artwork.py and transcode.py do the rest.
+# Rate and connections come from the scheduler's budget (limits), not from here
+DOWNLOAD_ARGS = [
+    "--ignore-errors",
+    "--format", "bestaudio[ext=m4a]/bestaudio/best",
+    "--output", "%(title)s.%(ext)s",
+] + EXTRACTOR_ARGS
+# How yt-dlp reports entries it passes over: in the download archive, or filtered out by skip_ids
+SKIP_REASONS = ("has already been recorded in the archive", "already in library")
+# Entries that will not download on any later run either. Age and members-only
+# checks are left out, other cookies can still get those
+UNAVAILABLE_PATTERNS = [
+    r"video unavailable",
+    r"private video",
+    r"video has been removed",
+    r"no longer available",
+    r"not available in your country",
+    r"account .* (?:terminated|closed)",
+]
+UNAVAILABLE_RE = re.compile("|".join(UNAVAILABLE_PATTERNS), re.IGNORECASE)
+# "ERROR: [youtube] <id>: <reason>"
+ENTRY_ERROR_RE = re.compile(r"^ERROR: \[(\w+)\] ([\w-]+): (.*)$")
+
+def unavailable_entries(errors):
+    # {archive id: error} for the entries yt-dlp reported as gone for good
+    found = {}
+    for msg in errors:
+        match = ENTRY_ERROR_RE.match(msg)
+        if match and UNAVAILABLE_RE.search(match.group(3)) and not is_throttle_error([msg]):
+            found[f"{match.group(1).lower()} {match.group(2)}"] = msg
+    return found
+
+class JobLogger:
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.errors = []
+        self.warnings = []
+        self.bytes = 0
+        # Time spent receiving files, and entries passed over (archive, library)
+        self.seconds = 0.0
+        self.skipped = 0
+        self.files = []
+        self.on_file = None
+        self.bandwidth = None
+        self._received = {}
+        self._lock = threading.Lock()
+
+    def debug(self, msg):
+        if msg.startswith("[download] ") and msg.endswith(SKIP_REASONS):
+            self.skipped += 1
+        if self.echo and not msg.startswith("[debug] "):
+            print(msg)
+
+    def info(self, msg):
+        self.debug(msg)
+
+    def warning(self, msg):
+        self.warnings.append(msg)
+        if self.echo:
+            print(msg)
+
+    def error(self, msg):
+        self.errors.append(msg)
+        if self.echo:
+            print(msg)
+
+    def received(self, name, total):
+        # Fragment downloads report from several threads, take each byte once
+        with self._lock:
+            new = total - self._received.get(name, 0)
+            if new > 0:
+                self._received[name] = total
+        return max(new, 0)
+
+def track_metadata(info):
+    artists = info.get("artists") or []
+    date = info.get("release_date") or info.get("upload_date") or ""
+    return {
+        "title": info.get("track") or info.get("title"),
+        "artist": ", ".join(artists) if artists else info.get("artist") or info.get("creator") or info.get("uploader") or info.get("channel"),
+        "album": info.get("album"),
+        "album_artist": info.get("album_artist"),
+        "track": info.get("track_number"),
+        "date": str(info.get("release_year") or date[:4] or ""),
+        "comment": info.get("webpage_url"),
+    }
+
+class RecordFilesPP(PostProcessor):
+    def run(self, info):
+        logger = self._downloader.params.get("logger")
+        if isinstance(logger, JobLogger) and info.get("filepath"):
+            track = {
+                "id": info.get("id"),
+                "title": info.get("title"),
+                "filepath": info["filepath"],
+                "archive_id": self._downloader._make_archive_id(info),
+                "metadata": track_metadata(info),
+                "thumbnails": thumbnail_urls(info),
+            }
+            logger.files.append(track)
+            if logger.on_file:
+                logger.on_file(track)
+        return [], info
+
+def skip_ids_filter(skip_ids):
+    def match(info, incomplete=False):
+        if info.get("id") in skip_ids:
+            return SKIP_REASONS[1]
+        return None
+    return match
+
+def cookie_args(browser, cookies=True):
+    if cookies and browser != "none":
+        return ["--cookies-from-browser", browser]
+    return []
+
+class YtDlpEngine:
+    def __init__(self, pool_size=5, cache=None, cookie_dir=None, on_errors=None, extractors=None):
+        self.pool_size = pool_size
+        self.extractors = extractors
+        self.cache = cache
+        self.cookie_dir = cookie_dir
+        self.on_errors = on_errors
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._created = {}
+        self._cookie_sessions = {}
+
+    def _cookie_session(self, browser):
+        with self._lock:
+            if browser not in self._cookie_sessions:
+                self._cookie_sessions[browser] = CookieSession(browser, self.cookie_dir)
+            return self._cookie_sessions[browser]
+
+    def cookie_args(self, browser, cookies=True):
+        if not cookies or browser == "none":
+            return []
+        if not self.cookie_dir:
+            return cookie_args(browser, cookies)
+        path = self._cookie_session(browser).cookie_file()
+        return ["--cookies", path] if path else []
+
+    def cookie_generation(self, browser):
+        if browser == "none" or not self.cookie_dir:
+            return 0
+        return self._cookie_session(browser).generation
+
+    def refresh_cookies(self, browser, seen_generation):
+        if browser == "none" or not self.cookie_dir:
+            return False
+        refreshed = self._cookie_session(browser).refresh(seen_generation)
+        if refreshed:
+            # Pooled instances keep the cookie jar they were built with
+            with self._lock:
+                self._pools = {}
+                self._created = {}
+        return refreshed
+
+    def _build(self, args):
+        params = yt_dlp.parse_options(list(args)).ydl_opts
+        if self.extractors:
+            # Only the given extractors, e.g. the offline benchmark backend
+            params["allowed_extractors"] = []
+        ydl = yt_dlp.YoutubeDL(params)
+        for ie in self.extractors or ():
+            ydl.add_info_extractor(ie())
+        ydl.add_progress_hook(lambda d: on_progress(ydl, d))
+        ydl.add_post_processor(RecordFilesPP(ydl), when="after_move")
+        return ydl
+
+    def _pool(self, key):
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = queue.LifoQueue()
+                self._created[key] = 0
+            pool = self._pools[key]
+            try:
+                return pool, pool.get_nowait()
+            except queue.Empty:
+                if self._created[key] < self.pool_size:
+                    self._created[key] += 1
+                    return pool, None
+        return pool, pool.get()
+
+    @contextmanager
+    def checkout(self, args, **overrides):
+        key = tuple(args)
+        pool, ydl = self._pool(key)
+        if ydl is None:
+            try:
+                ydl = self._build(key)
+            except Exception:
+                with self._lock:
+                    self._created[key] -= 1
+                raise
+        saved = {k: ydl.params.get(k) for k in overrides}
+        ydl.params.update(overrides)
+        try:
+            yield ydl
+        finally:
+            ydl.params.update(saved)
+            pool.put(ydl)
+
+    def extract(self, url, browser, cookies=True, errors=None):
+        cache_args = EXTRACT_ARGS + (["--cookies"] if cookies and browser != "none" else [])
+        if self.cache:
+            data = self.cache.get(url, cache_args)
+            if data is not None:
+                METRICS.count("metadata_cache_hits")
+                return data
+        data = None
+        start = time.perf_counter()
+        for attempt in range(2):
+            generation = self.cookie_generation(browser)
+            logger = JobLogger()
+            try:
+                with self.checkout(EXTRACT_ARGS + self.cookie_args(browser, cookies), logger=logger) as ydl:
+                    info = ydl.extract_info(url, download=False)
+                    data = ydl.sanitize_info(info) if info else None
+            except Exception as e:
+                logger.errors.append(str(e))
+            if data is not None or attempt or not cookies:
+                break
+            if not (is_auth_error(logger.errors) and self.refresh_cookies(browser, generation)):
+                break
+            METRICS.count("cookie_retries")
+        METRICS.record("extract", time.perf_counter() - start, data is not None, url=url, attempts=attempt + 1,
+                       entries=len((data or {}).get("entries") or []), error=logger.errors[-1] if logger.errors else None)
+        if data is None and self.on_errors:
+            self.on_errors(logger.errors)
+        if data is None and errors is not None:
+            errors.extend(logger.errors)
+        if self.cache and data is not None:
+            self.cache.put(url, data, cache_args)
+        return data
+
+    def stream(self, url, browser, cookies=True, meta=None):
+        cache_args = EXTRACT_ARGS + (["--cookies"] if cookies and browser != "none" else [])
+        cached = self.cache.get(url, cache_args) if self.cache else None
+        if cached is not None:
+            METRICS.count("metadata_cache_hits")
+            if meta is not None:
+                meta.update({k: v for k, v in cached.items() if k != "entries"})
+            yield from cached.get("entries") or []
+            return
+        logger = JobLogger()
+        head = None
+        entries = []
+        start = time.perf_counter()
+        try:
+            with self.checkout(EXTRACT_ARGS + self.cookie_args(browser, cookies), logger=logger) as ydl:
+                # process=False keeps the extractor's lazy entry generator, so pages are
+                # fetched while the caller is already queueing what was found so far
+                info = ydl.extract_info(url, download=False, process=False)
+                if info and info.get("_type") in ("url", "url_transparent"):
+                    info = ydl.extract_info(url, download=False)
+                if not info:
+                    return
+                head = ydl.sanitize_info({k: v for k, v in info.items() if k != "entries"})
+                if meta is not None:
+                    meta.update(head)
+                for entry in info.get("entries") or []:
+                    if entry is None:
+                        continue
+                    entry = ydl.sanitize_info(entry)
+                    entries.append(entry)
+                    yield entry
+        except Exception as e:
+            logger.errors.append(str(e))
+        # Includes the time the caller spent on each entry, as the pages are fetched lazily
+        METRICS.record("extract", time.perf_counter() - start, head is not None, url=url, entries=len(entries),
+                       streamed=True, error=logger.errors[-1] if logger.errors else None)
+        if logger.errors:
+            if head is None and self.on_errors:
+                self.on_errors(logger.errors)
+            return
+        if self.cache and head is not None:
+            self.cache.put(url, dict(head, entries=entries), cache_args)
+
+    def download(self, url, output_dir, browser, cookies=True, **options):
+        generation = self.cookie_generation(browser)
+        result = self._download(url, output_dir, browser, cookies, options)
+        if cookies and not result["ok"] and is_auth_error(result["errors"]):
+            if self.refresh_cookies(browser, generation) or self.cookie_generation(browser) != generation:
+                METRICS.count("cookie_retries")
+                print(f"🔁 Retrying with fresh cookies: {url}")
+                result = self._download(url, output_dir, browser, cookies, options)
+        return result
+
+    def _download(self, url, output_dir, browser, cookies, options):
+        args = DOWNLOAD_ARGS + self.cookie_args(browser, cookies)
+        if options.get("playlist"):
+            args = ["--yes-playlist"] + args
+        archive = options.get("archive")
+        info = options.get("info")
+        limits = options.get("limits")
+        skip_ids = options.get("skip_ids")
+        logger = JobLogger(echo=True)
+        logger.on_file = options.get("on_file")
+        overrides = {
+            "logger": logger,
+            "paths": {"home": output_dir},
+            # Callers that finish files later (transcode stage) write archive records themselves
+            "download_archive": archive if options.get("record_archive", True) else None,
+            "match_filter": skip_ids_filter(skip_ids) if skip_ids else None,
+        }
+        if limits:
+            logger.bandwidth = limits["bandwidth"]
+            overrides["concurrent_fragment_downloads"] = limits["fragments"]
+        retcode = 1
+        start = time.perf_counter()
+        try:
+            with self.checkout(args, **overrides) as ydl:
+                ydl.archive = load_archive(archive)
+                ydl._download_retcode = 0
+                try:
+                    if info:
+                        # Reuse the (possibly cached) flat extraction instead of fetching the page again
+                        ydl.process_ie_result(copy.deepcopy(info), download=True)
+                        retcode = ydl._download_retcode
+                    else:
+                        retcode = ydl.download([url])
+                finally:
+                    ydl.archive = set()
+        except Exception as e:
+            logger.error(str(e))
+        ok = retcode == 0 and not logger.errors
+        METRICS.record("download", time.perf_counter() - start, ok, logger.bytes, url=url, tracks=len(logger.files),
+                       errors=len(logger.errors), error=logger.errors[-1] if logger.errors else None)
+        return {"url": url, "ok": ok, "errors": logger.errors, "bytes": logger.bytes, "files": logger.files,
+                "download_seconds": logger.seconds, "skipped": logger.skipped}
+
+def on_progress(ydl, d):
+    logger = ydl.params.get("logger")
+    if d.get("status") == "downloading" and isinstance(logger, JobLogger) and logger.bandwidth:
+        # Charge what arrived since the last report to the shared budget, sleeping
+        # here holds this download back until the budget allows it again
+        name = d.get("tmpfilename") or d.get("filename")
+        logger.bandwidth.consume(logger.received(name, d.get("downloaded_bytes") or 0))
+    if d.get("status") == "finished" and isinstance(logger, JobLogger):
+        size = d.get("total_bytes") or d.get("downloaded_bytes") or 0
+        logger.bytes += size
+        logger.seconds += d.get("elapsed") or 0
+        info = d.get("info_dict") or {}
+        METRICS.event("track", id=info.get("id"), title=info.get("title"), bytes=size, seconds=round(d.get("elapsed") or 0, 3))
+
+ARCHIVE_LOCK = threading.Lock()
+
+def append_archive(path, archive_id):
+    if not path or not archive_id:
+        return
+    with ARCHIVE_LOCK:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(archive_id + "\n")
+
+def load_archive(path):
+    archive = set()
+    if not path:
+        return archive
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                archive.add(line.strip())
+    except OSError:
+        pass
+    return archive
+
+def run_subprocess_json(url, browser, cookies=True):
+    args = ["yt-dlp", "--flat-playlist", "-J"] + cookie_args(browser, cookies) + EXTRACTOR_ARGS + [url]
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return None
+
+def compare_overhead(engine, urls, browser, rounds=3):
+    timings = {"subprocess": [], "in-process": []}
+    for _ in range(rounds):
+        for url in urls:
+            start = time.perf_counter()
+            run_subprocess_json(url, browser)
+            timings["subprocess"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            engine.extract(url, browser)
+            timings["in-process"].append(time.perf_counter() - start)
+    report = {}
+    for name, values in timings.items():
+        report[name] = {
+            "items": len(values),
+            "first": values[0] if values else 0.0,
+            "mean": sum(values) / len(values) if values else 0.0,
+            "total": sum(values),
+        }
+    return report
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+
+JOURNAL_NAME = ".journal.json"
+ARCHIVE_NAME = ".archive.txt"
+
+def write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def write_json_atomic(path, data):
+    write_atomic(path, json.dumps(data, indent=2, ensure_ascii=False))
+
+class ArtistJournal:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, JOURNAL_NAME)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.data = {"releases": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not read {self.path}, starting a new journal: {e}")
+        self.data.setdefault("releases", {})
+
+    def _save(self):
+        # Written in batches by the artist's ManifestWriter (flush), not on every change
+        self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return False
+            os.makedirs(self.output_dir, exist_ok=True)
+            write_json_atomic(self.path, self.data)
+            self._dirty = False
+            return True
+
+    def release(self, url):
+        with self._lock:
+            return dict(self.data["releases"].get(url, {}))
+
+    def unfinished(self):
+        with self._lock:
+            return {url: dict(release) for url, release in self.data["releases"].items() if release.get("status") != "done"}
+
+    @property
+    def last_sync(self):
+        return self.data.get("last_sync")
+
+    def needs_sync(self, url, track_count=None):
+        release = self.release(url)
+        if not release:
+            return "new"
+        if release.get("status") != "done":
+            return "unfinished"
+        known = release.get("track_count")
+        if known is None:
+            return None
+        # Listings can count tracks the extraction never returns, so compare
+        # against the largest count already acted on
+        if track_count and track_count > max(known, release.get("listed_count") or 0):
+            return "changed"
+        return None
+
+    def note_listed_count(self, url, track_count):
+        with self._lock:
+            self.data["releases"].setdefault(url, {"tracks": {}})["listed_count"] = track_count
+            self._save()
+
+    def mark_synced(self):
+        with self._lock:
+            self.data["last_sync"] = time.time()
+            self._save()
+
+    def start_release(self, url, folder, title, track_ids=None):
+        with self._lock:
+            release = self.data["releases"].setdefault(url, {"tracks": {}})
+            release.update({
+                "folder": os.path.basename(folder),
+                "title": title,
+                "status": "running",
+                "started": time.time(),
+            })
+            if track_ids is not None:
+                release["track_ids"] = list(track_ids)
+                release["track_count"] = len(track_ids)
+            self._save()
+
+    def finish_release(self, url, result):
+        with self._lock:
+            release = self.data["releases"].setdefault(url, {"tracks": {}})
+            tracks = release.setdefault("tracks", {})
+            for track in result.get("files", []):
+                if track.get("id"):
+                    tracks[track["id"]] = os.path.basename(track["filepath"])
+            release["status"] = "done" if result.get("ok") else "failed"
+            release["errors"] = result.get("errors", [])[-5:]
+            # Gone for good, recorded in the release archive so no later sync asks again
+            release["unavailable"] = result.get("unavailable", [])
+            release["finished"] = time.time()
+            self._save()
+
+    def folder_for(self, url):
+        folder = self.release(url).get("folder")
+        if folder and os.path.isdir(os.path.join(self.output_dir, folder)):
+            return os.path.join(self.output_dir, folder)
+        return None
+
+def folder_belongs_to(folder, url):
+    tracks_txt = os.path.join(folder, "tracks.txt")
+    try:
+        with open(tracks_txt, "r") as f:
+            lines = f.read().split("\n")
+    except OSError:
+        return False
+    return len(lines) > 1 and lines[1].strip() == url
+
+def release_folder(output_dir, release_name, url, journal=None, taken=()):
+    known = journal.folder_for(url) if journal else None
+    if known:
+        return known
+    base_folder = os.path.join(output_dir, release_name)
+    target_folder = base_folder
+    suffix = 1
+    # taken: folders other running jobs are still staging, not created yet
+    while (os.path.exists(target_folder) and not folder_belongs_to(target_folder, url)) or target_folder in taken:
+        target_folder = f"{base_folder} ({suffix})"
+        suffix += 1
+    return target_folder
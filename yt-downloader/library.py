@@ -0,0 +1,98 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+FICLONE = 0x40049409
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+def link_or_copy(src, dst):
+    for method, fn in (("hardlink", os.link), ("reflink", reflink), ("copy", shutil.copy2)):
+        try:
+            fn(src, dst)
+            return method
+        except OSError:
+            continue
+    return None
+
+class TrackIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "video_id TEXT PRIMARY KEY, path TEXT, size INTEGER, sha256 TEXT, added REAL)"
+            )
+        return self._db
+
+    def lookup(self, video_id):
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT path, size, sha256 FROM tracks WHERE video_id = ?", (video_id,)).fetchone()
+            if not row:
+                return None
+            path, size, sha256 = row
+            try:
+                if os.path.getsize(path) == size:
+                    return {"video_id": video_id, "path": path, "size": size, "sha256": sha256}
+            except OSError:
+                pass
+            # The stored copy was moved or deleted; forget it so the track is fetched again
+            db.execute("DELETE FROM tracks WHERE video_id = ?", (video_id,))
+            db.commit()
+        return None
+
+    def add(self, video_id, path):
+        if not video_id or not os.path.isfile(path):
+            return
+        size = os.path.getsize(path)
+        sha256 = file_sha256(path)
+        with self._lock:
+            db = self._conn()
+            db.execute(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?)",
+                (video_id, os.path.abspath(path), size, sha256, time.time()),
+            )
+            db.commit()
+
+    def link_into(self, video_id, folder):
+        track = self.lookup(video_id)
+        if not track:
+            return None
+        dst = os.path.join(folder, os.path.basename(track["path"]))
+        if os.path.exists(dst):
+            return dst
+        if os.path.abspath(dst) == track["path"]:
+            return dst
+        os.makedirs(folder, exist_ok=True)
+        method = link_or_copy(track["path"], dst)
+        if not method:
+            return None
+        print(f"🔗 Reused {os.path.basename(dst)} ({method})")
+        return dst
@@ -3,17 +3,61 @@ import re
 import sys
 import subprocess
 import json
-from concurrent.futures import ThreadPoolExecutor
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import itertools
+import argparse
+import shutil
+import socket
+import tempfile
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from engine import YtDlpEngine, append_archive, compare_overhead, load_archive, unavailable_entries
+from metacache import MetadataCache
+from scheduler import DownloadScheduler, parse_rate
+from library import TrackIndex
+from journal import ARCHIVE_NAME, ArtistJournal, release_folder
+from discovery import ChannelInfo, ReleaseInfo, discover_channel
+from manifest import ManifestWriter, load_albums, write_albums, write_tracks
+from transcode import Transcoder
+from artwork import ArtworkCache, thumbnail_urls
+from metrics import METRICS
+from staging import StagingArea
+from workqueue import DONE, FAILED, LEASE_SECONDS, WorkQueue
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 BROWSER_FILE = os.path.join(SCRIPT_DIR, "browser.json")
 DEFAULT_BROWSER = "none"
+SETTINGS_FILE = os.path.join(SCRIPT_DIR, "settings.json")
+# Stop listing a discography after this many already-synced releases in a row
+KNOWN_STREAK = 10
+POLL_SECONDS = 1
+# Warm headless browsers shared by all channels that need the scraping fallback
+SCRAPER_SESSIONS = 2
+DEFAULT_SETTINGS = {"max_jobs": 5, "max_connections": 40, "total_rate": "10M", "audio_format": "mp3", "transcode_workers": 0,
+                    "staging_dir": "", "staging_limit": "4G"}
+OUTPUT_DIR = "output"
+CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache")
+METADATA_CACHE = MetadataCache(os.path.join(CACHE_DIR, "metadata.sqlite"))
+TRACK_INDEX = TrackIndex(os.path.join(CACHE_DIR, "library.sqlite"))
+ARTWORK = ArtworkCache(os.path.join(CACHE_DIR, "artwork"))
+STAGING = StagingArea(os.path.join(OUTPUT_DIR, ".staging"))
+ENGINE = YtDlpEngine(pool_size=5, cache=METADATA_CACHE, cookie_dir=CACHE_DIR)
+SCRAPER = None
+SCRAPER_LOCK = threading.Lock()
+METRICS.log_path = os.path.join(CACHE_DIR, "events.jsonl")
+
+def set_output_dir(path, cache_dir=None):
+    # The caches open their databases lazily, so repointing them is enough
+    # as long as nothing has been downloaded yet
+    global OUTPUT_DIR, CACHE_DIR
+    OUTPUT_DIR = path
+    CACHE_DIR = cache_dir or os.path.join(path, ".cache")
+    METADATA_CACHE.path = os.path.join(CACHE_DIR, "metadata.sqlite")
+    TRACK_INDEX.path = os.path.join(CACHE_DIR, "library.sqlite")
+    ARTWORK.path = os.path.join(CACHE_DIR, "artwork")
+    ENGINE.cookie_dir = CACHE_DIR
+    METRICS.log_path = os.path.join(CACHE_DIR, "events.jsonl")
+    configure_staging(load_settings())
 
 def get_channel_name(url, browser, scraped_name=None):
     if scraped_name:
@@ -57,218 +101,186 @@ def save_browser(browser):
     with open(BROWSER_FILE, "w") as f:
         json.dump({"browser": browser}, f)
 
-def run_yt_dlp_json(url, browser, cookies=True):
-    args = [
-        "yt-dlp", "--flat-playlist", "-J", "--extractor-args", "youtube:player-client=default,-tv_simply", url
-    ]
-    if cookies and browser != "none":
-        args.insert(2, "--cookies-from-browser")
-        args.insert(3, browser)
-    try:
-        result = subprocess.run(args, capture_output=True, text=True, check=True)
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError:
-        return None
+def load_settings():
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, "r") as f:
+            try:
+                settings.update(json.load(f))
+            except Exception:
+                pass
+    return settings
 
-def get_release_urls(url, output_dir, browser):
+def save_settings(settings):
+    with open(SETTINGS_FILE, "w") as f:
+        json.dump(settings, f, indent=2)
+
+def make_scheduler(settings):
+    ENGINE.pool_size = max(1, int(settings["max_jobs"]))
+    return DownloadScheduler(settings["max_jobs"], settings["max_connections"], settings["total_rate"])
+
+def make_transcoder(settings):
+    mode = "native" if settings["audio_format"] == "native" else "mp3"
+    return Transcoder(int(settings["transcode_workers"]), mode)
+
+def configure_staging(settings):
+    # Empty means <output>/.staging, next to the library
+    STAGING.path = settings["staging_dir"] or os.path.join(OUTPUT_DIR, ".staging")
+    STAGING.limit = parse_rate(settings["staging_limit"])
+
+SCHEDULER = make_scheduler(load_settings())
+TRANSCODER = make_transcoder(load_settings())
+configure_staging(load_settings())
+ENGINE.on_errors = lambda errors: SCHEDULER.limiter.record_errors(errors)
+
+def run_yt_dlp_json(url, browser, cookies=True, errors=None):
+    return ENGINE.extract(url, browser, cookies=cookies, errors=errors)
+
+def release_from_entry(e):
+    if isinstance(e, str):
+        return ReleaseInfo(url=e)
+    return ReleaseInfo(
+        url=e.get("url"),
+        title=e.get("title") or "Unknown",
+        id=e.get("id"),
+        track_count=e.get("track_count") or e.get("playlist_count") or (1 if e.get("duration") else None),
+        duration=e.get("duration"),
+    )
+
+def iter_release_entries(url, browser, channel=None):
+    channel = channel or ChannelInfo(url=url)
+    # Callers may stop early (known-release streak), the finally still records it
+    with METRICS.timed("discovery", url=url) as span:
+        try:
+            yield from discover_releases(url, browser, channel)
+        finally:
+            span.update(source=channel.source, releases=len(channel.releases), ok=bool(channel.releases))
+
+def discover_releases(url, browser, channel):
     base_url = url.rstrip("/").split("?")[0]
     base_url = re.sub(r'/(releases|playlists?|videos|channels|featured|about|community|store|search).*$', '', base_url)
     releases_url = base_url + "/releases"
-    data = run_yt_dlp_json(releases_url, browser)
-    entries = []
-    scraped_channel_name = None
-    
-    if data and "entries" in data:
-        print("✅ Found /releases page")
-        entries = [e for e in data["entries"] if e.get("url")]
-    else:
-        print("❌ /releases page not available, trying web scraping...")
-        try:
-            scrape_result = scrape_topic_channel_links(base_url, browser)
-            if isinstance(scrape_result, dict):
-                entries = scrape_result.get("links", [])
-                scraped_channel_name = scrape_result.get("channel_name")
-            else:
-                entries = scrape_result if scrape_result else []
-        except Exception as e:
-            print(f"❌ Web scraping failed: {e}")
-            entries = []
-    
     seen = set()
-    filtered = []
-    for e in entries:
-        if isinstance(e, dict):
-            url_entry = e.get("url")
-            title = e.get("title", "Unknown")
+    stream_meta = {}
+    found = False
+    for e in ENGINE.stream(releases_url, browser, meta=stream_meta):
+        if not found:
+            print("✅ Found /releases page")
+            found = True
+            channel.source = "releases"
+            name = stream_meta.get("channel") or stream_meta.get("uploader")
+            if name:
+                channel.name = re.sub(r'[<>:"/\\|?*]', '_', name).strip()
+            channel.id = stream_meta.get("channel_id") or stream_meta.get("uploader_id")
+        release = release_from_entry(e)
+        if release.url and release.url not in seen:
+            seen.add(release.url)
+            channel.releases.append(release)
+            yield release
+    if found:
+        return
+    entries = []
+    print("❌ /releases page not available, trying browserless discovery...")
+    try:
+        scrape_result = discover_channel(base_url)
+        if not scrape_result.get("links"):
+            raise ValueError("no playlists or videos found on the channel page")
+        print(f"✅ Found {len(scrape_result['links'])} items without a browser")
+        channel.source = "browserless"
+    except Exception as e:
+        print(f"⚠️ Browserless discovery failed ({e}), trying web scraping...")
+        scrape_result = None
+    try:
+        if scrape_result is None:
+            scrape_result = scrape_topic_channel_links(base_url)
+            channel.source = "scraper"
+        if isinstance(scrape_result, dict):
+            entries = scrape_result.get("links", [])
+            channel.name = scrape_result.get("channel_name") or channel.name
+            channel.id = scrape_result.get("channel_id") or channel.id
         else:
-            url_entry = e
-            title = "Unknown"
-        if url_entry and url_entry not in seen:
-            filtered.append({"url": url_entry, "title": title})
-            seen.add(url_entry)
-    albums_file = os.path.join(output_dir, "albums.txt")
-    with open(albums_file, "w") as f:
-        for idx, e in enumerate(filtered, 1):
-            title = e.get("title", "Unknown")
-            url = e.get("url")
-            f.write(f"{idx}. {title}\n{url}\n\n")
-    
-    result = [e["url"] for e in filtered]
-    if scraped_channel_name:
-        return {"urls": result, "channel_name": scraped_channel_name}
+            entries = scrape_result if scrape_result else []
+    except Exception as e:
+        print(f"❌ Web scraping failed: {e}")
+        entries = []
+    for e in entries:
+        release = release_from_entry(e)
+        if release.url and release.url not in seen:
+            seen.add(release.url)
+            channel.releases.append(release)
+            yield release
+
+def discover_channel_info(url, browser):
+    channel = ChannelInfo(url=url)
+    for _ in iter_release_entries(url, browser, channel):
+        pass
+    return channel
+
+def release_fields(release):
+    fields = {"tracks": release.track_count, "duration": release.duration}
+    if release.title != "Unknown":
+        fields["title"] = release.title
+    return {k: v for k, v in fields.items() if v is not None}
+
+def releases_to_sync(channel, releases, journal, manifest, full=False):
+    streak = 0
+    seen = set()
+    for release in releases:
+        seen.add(release.url)
+        manifest.update(release.url, **release_fields(release))
+        reason = journal.needs_sync(release.url, release.track_count)
+        if reason:
+            streak = 0
+            if reason == "changed":
+                # The cached tracklist predates the new tracks
+                METADATA_CACHE.invalidate(release.url)
+                journal.note_listed_count(release.url, release.track_count)
+            yield release, reason
+            continue
+        streak += 1
+        # /releases lists newest first, so a run of known releases means the rest is known too
+        if not full and channel.source == "releases" and journal.last_sync and streak >= KNOWN_STREAK:
+            print(f"⏭️ {streak} synced releases in a row, skipping the rest of the discography.")
+            # Failed or interrupted releases further down would never be listed again
+            for url, known in journal.unfinished().items():
+                if url not in seen:
+                    yield ReleaseInfo(url=url, title=known.get("title") or "Unknown",
+                                      track_count=known.get("listed_count") or known.get("track_count")), "unfinished"
+            break
+    journal.mark_synced()
+
+def get_release_urls(url, output_dir, browser):
+    channel = discover_channel_info(url, browser)
+    albums = {a["url"]: a for a in load_albums(output_dir)}
+    for r in channel.releases:
+        albums.setdefault(r.url, {}).update(dict({"url": r.url, "title": r.title}, **release_fields(r)))
+    write_albums(output_dir, list(albums.values()))
+    result = [r.url for r in channel.releases]
+    if channel.name:
+        return {"urls": result, "channel_name": channel.name}
     return result
 
-def scrape_topic_channel_links(channel_url, browser_name):
+def get_scraper():
+    global SCRAPER
+    with SCRAPER_LOCK:
+        if SCRAPER is None:
+            # Selenium is only imported once a channel actually needs the browser
+            from scraper import ScraperPool
+            SCRAPER = ScraperPool(SCRAPER_SESSIONS)
+        return SCRAPER
+
+def close_scraper():
+    global SCRAPER
+    with SCRAPER_LOCK:
+        if SCRAPER is not None:
+            SCRAPER.close()
+            SCRAPER = None
+
+def scrape_topic_channel_links(channel_url):
     try:
-        options = Options()
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        options.set_preference("dom.webdriver.enabled", False)
-        options.set_preference("useAutomationExtension", False)
-        driver = webdriver.Firefox(options=options)
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        driver.get(channel_url)
-        accept_buttons = [
-            "//button[contains(text(), 'Accept all')]",
-            "//button[contains(text(), 'I agree')]", 
-            "//button[contains(text(), 'Accetta tutto')]",
-            "//button[contains(text(), 'Reject all')]",
-            "//button[contains(text(), 'Rifiuta tutto')]",
-            "//form[@action='https://consent.youtube.com/save']//button[1]",
-            "//button[@aria-label='Accept all']",
-            "//button[@aria-label='Reject all']"
-        ]
-        button_clicked = False
-        for xpath in accept_buttons:
-            try:
-                button = WebDriverWait(driver, 2).until(
-                    EC.element_to_be_clickable((By.XPATH, xpath))
-                )
-                button.click()
-                button_clicked = True
-                time.sleep(2)
-                break
-            except:
-                continue
-        time.sleep(3)
-        
-        channel_name = None
-        try:
-            channel_element = WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.XPATH, "//html/body/ytd-app/div[1]/ytd-page-manager/ytd-browse/div[4]/ytd-tabbed-page-header/div/div[2]/yt-page-header-renderer/yt-page-header-view-model/div/div[1]/div/yt-dynamic-text-view-model/h1/span"))
-            )
-            channel_name = channel_element.text.strip()
-            if channel_name:
-                channel_name = re.sub(r' - Topic$', '', channel_name)
-                channel_name = re.sub(r'[<>:"/\\|?*]', '_', channel_name)
-                print(f"✅ Extracted channel name from page: {channel_name}")
-        except:
-            print("⚠️ Could not extract channel name from page")
-        
-        try:
-            show_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//html/body/ytd-app/div[1]/ytd-page-manager/ytd-browse/ytd-two-column-browse-results-renderer/div[1]/ytd-section-list-renderer/div[2]/ytd-item-section-renderer/div[3]/ytd-shelf-renderer/div[1]/div[1]/div/div[3]/ytd-menu-renderer/div[1]/ytd-button-renderer/yt-button-shape/button"))
-            )
-            driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", show_button)
-            time.sleep(1)
-            try:
-                show_button.click()
-            except:
-                driver.execute_script("arguments[0].click();", show_button)
-            time.sleep(3)
-        except Exception:
-            pass
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        scroll_attempts = 0
-        max_scrolls = 8
-        while scroll_attempts < max_scrolls:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(3)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
-            scroll_attempts += 1
-        for i in range(2):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
-            driver.execute_script("window.scrollTo(0, 0);")
-            time.sleep(1)
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(3)
-        js_script = """
-        const allLinks = [...document.querySelectorAll('a[href]')]
-            .map(a => a.href)
-            .filter(href => href && (href.includes('/playlist?list=') || href.includes('/watch?v=')))
-            .filter(href => !href.includes('music.youtube.com'))
-            .filter(href => !href.includes('youtube.com/shorts'))
-            .map(href => {
-                try {
-                    const url = new URL(href);
-                    if (url.pathname.includes('/playlist')) {
-                        const listId = url.searchParams.get('list');
-                        return listId ? `https://www.youtube.com/playlist?list=${listId}` : null;
-                    } else if (url.pathname.includes('/watch')) {
-                        const videoId = url.searchParams.get('v');
-                        const listId = url.searchParams.get('list');
-                        if (videoId && listId) {
-                            return `https://www.youtube.com/playlist?list=${listId}`;
-                        } else if (videoId) {
-                            return `https://www.youtube.com/watch?v=${videoId}`;
-                        }
-                    }
-                    return null;
-                } catch (e) {
-                    return null;
-                }
-            })
-            .filter(href => href !== null)
-            .filter((href, index, array) => array.indexOf(href) === index);
-        return allLinks;
-        """
-        links = driver.execute_script(js_script)
-        driver.quit()
-        filtered_links = []
-        seen_playlists = set()
-        seen_videos = set()
-        seen_video_playlist_pairs = set()
-        for link in links:
-            if '/playlist?list=' in link:
-                playlist_id = link.split('list=')[1].split('&')[0]
-                if playlist_id not in seen_playlists and len(playlist_id) > 10:
-                    seen_playlists.add(playlist_id)
-                    filtered_links.append({"url": link, "title": "Unknown"})
-            elif '/watch?v=' in link:
-                if '&list=' in link:
-                    video_id = link.split('v=')[1].split('&')[0]
-                    playlist_id = link.split('list=')[1].split('&')[0]
-                    pair = f"{video_id}:{playlist_id}"
-                    if pair not in seen_video_playlist_pairs and len(video_id) == 11 and len(playlist_id) > 10:
-                        seen_video_playlist_pairs.add(pair)
-                        playlist_url = f"https://www.youtube.com/playlist?list={playlist_id}"
-                        if playlist_id not in seen_playlists:
-                            seen_playlists.add(playlist_id)
-                            filtered_links.append({"url": playlist_url, "title": "Unknown"})
-                else:
-                    video_id = link.split('v=')[1].split('&')[0]
-                    if video_id not in seen_videos and len(video_id) == 11:
-                        seen_videos.add(video_id)
-                        filtered_links.append({"url": link, "title": "Unknown"})
-        
-        result = {"links": filtered_links}
-        if channel_name:
-            result["channel_name"] = channel_name
-        return result
-    except Exception:
-        if 'driver' in locals():
-            try:
-                driver.quit()
-            except:
-                pass
+        return get_scraper().scrape(channel_url)
+    except Exception as e:
+        print(f"⚠️ Browser scraping failed for {channel_url}: {e}")
         return {"links": []}
 
 def sanitize_folder(name):
@@ -276,153 +288,215 @@ def sanitize_folder(name):
     name = re.sub(r'[:/]', ' -', name)
     return name
 
-def update_albums_txt(output_dir, url, real_title):
-    albums_file = os.path.join(output_dir, "albums.txt")
-    if not os.path.exists(albums_file):
-        return
+def entry_video_id(entry):
+    if entry.get("ie_key") not in (None, "Youtube"):
+        return None
+    video_id = entry.get("id")
+    if video_id and len(video_id) == 11:
+        return video_id
+    m = re.search(r'[?&]v=([\w-]{11})', entry.get("url") or entry.get("webpage_url") or "")
+    return m.group(1) if m else None
+
+def reuse_library_tracks(entries, folder):
+    reused = set()
+    for entry in entries:
+        video_id = entry_video_id(entry)
+        if video_id and TRACK_INDEX.link_into(video_id, folder):
+            reused.add(video_id)
+            METRICS.count("library_reuses")
+    return reused
+
+def library_tracks(entries, archive=None):
+    # Tracks the library already has, to be linked in instead of downloaded. Entries
+    # in the release's archive are already in its folder and left alone
+    done = load_archive(archive)
+    found = set()
+    for entry in entries:
+        video_id = entry_video_id(entry)
+        if video_id and f"youtube {video_id}" not in done and TRACK_INDEX.lookup(video_id):
+            found.add(video_id)
+    return found
+
+def record_library_tracks(result):
+    for track in result.get("files", []):
+        try:
+            TRACK_INDEX.add(track.get("id"), track["filepath"])
+        except OSError as e:
+            print(f"⚠️ Could not index {track['filepath']}: {e}")
+    return result
+
+def fetch_tracks(url, target_folder, browser, cookie_option, archive=None, on_complete=None, cover=None, owns_folder=False, reuse=(), **options):
+    # owns_folder: nothing else stages into target_folder (a release), so the
+    # whole folder is moved into the library at once when the job is done.
+    # reuse: video IDs the library already has, linked into target_folder once
+    # it is finalized rather than copied through staging
+    if not owns_folder:
+        STAGING.wait_for_space()
+    STAGING.acquire(target_folder)
+    work = STAGING.folder(target_folder)
+    # Tracks an earlier, unfinished attempt at this release left in staging
+    previous = STAGING.staged(target_folder) if owns_folder else []
+    skip_ids = set(reuse) | {track["id"] for track in previous}
+    if skip_ids:
+        options["skip_ids"] = skip_ids
+    pending = []
+    def on_file(track):
+        future = TRANSCODER.submit(track["filepath"], work, track["metadata"], cover or ARTWORK.get(track["thumbnails"]))
+        pending.append((track, future))
+        if owns_folder:
+            # Recorded before finish() can run: done callbacks go in the order they were added
+            def staged(future):
+                if future.exception() is None and future.result()["ok"]:
+                    STAGING.stage_track(target_folder, track, future.result()["dest"])
+            future.add_done_callback(staged)
     try:
-        with open(albums_file, "r") as f:
-            content = f.read()
-        lines = content.split('\n')
-        for i, line in enumerate(lines):
-            if line.strip() == url:
-                if i > 0 and "Unknown" in lines[i-1]:
-                    prev_line = lines[i-1]
-                    if ". Unknown" in prev_line:
-                        number_part = prev_line.split(". Unknown")[0] + ". "
-                        lines[i-1] = number_part + real_title
+        result = ENGINE.download(url, STAGING.downloads(target_folder), browser, cookies=cookie_option, on_file=on_file, archive=archive, record_archive=False, limits=SCHEDULER.current_limits(), **options)
+    except Exception:
+        STAGING.release(target_folder, keep=owns_folder)
+        raise
+    def finish():
+        # Whatever goes wrong here, on_complete still has to hear about it, or a
+        # queued task would stay running forever
+        final = dict(result, files=[], ok=False)
+        try:
+            files = []
+            # Entries that are gone for good do not keep the release unfinished
+            unavailable = unavailable_entries(result["errors"])
+            errors = [e for e in result["errors"] if e not in unavailable.values()]
+            transcoded = [(track, os.path.join(work, track["file"])) for track in previous]
+            for track, future in pending:
+                try:
+                    out = future.result()
+                except Exception as e:
+                    out = {"ok": False, "error": str(e)}
+                if out["ok"]:
+                    transcoded.append((track, out["dest"]))
+                else:
+                    errors.append(f"Transcode failed for {track['title']}: {out['error']}")
+            try:
+                moved = STAGING.finalize(target_folder, None if owns_folder else [dest for _, dest in transcoded])
+                for video_id in reuse:
+                    if TRACK_INDEX.link_into(video_id, target_folder):
+                        METRICS.count("library_reuses")
                     else:
-                        lines[i-1] = prev_line.replace("Unknown", real_title)
-                break
-        with open(albums_file, "w") as f:
-            f.write('\n'.join(lines))
-    except Exception as e:
-        print(f"⚠️ Could not update albums.txt: {e}")
+                        errors.append(f"Could not reuse library track {video_id}")
+                for archive_id in unavailable:
+                    append_archive(archive, archive_id)
+            except OSError as e:
+                moved = {}
+                errors.append(f"Could not move finished files into {target_folder}: {e}")
+            for track, dest in transcoded:
+                if dest in moved:
+                    # Only what reached the library counts as downloaded
+                    append_archive(archive, track["archive_id"])
+                    files.append(dict(track, filepath=moved[dest]))
+            ok = not errors and (result["ok"] or bool(unavailable))
+            final = dict(result, files=files, errors=errors, ok=ok, unavailable=sorted(unavailable))
+            record_library_tracks(final)
+        except Exception as e:
+            final = dict(final, errors=final["errors"] + [f"Could not finish {url}: {e}"], ok=False)
+            raise
+        finally:
+            # A failed release keeps what it has staged for the next attempt
+            STAGING.release(target_folder, keep=owns_folder and not final["ok"])
+            if on_complete:
+                on_complete(final)
+    TRANSCODER.after([future for _, future in pending], finish)
+    return result
 
-def download_release(item_url, index, output_dir, cookie_option, browser):
-    if index % 5 == 0 and browser != "none":
-        print(f"♻️ Reloading cookies from {browser}...")
-        test = run_yt_dlp_json(item_url, browser)
-        if test:
-            cookie_option = True
-        else:
-            print("⚠️ Cookies are no longer valid, continuing without cookies.")
-            cookie_option = False
+def download_release(item_url, output_dir, cookie_option, browser, journal=None, manifest=None, on_finished=None):
     print(f"🎧 Downloading: {item_url}")
-    data = run_yt_dlp_json(item_url, browser, cookies=cookie_option)
-    release_name = sanitize_folder(data.get("title", "")) if data else None
-    real_title = data.get("title", "") if data else ""
+    start = time.time()
+    errors = []
+    data = run_yt_dlp_json(item_url, browser, cookies=cookie_option, errors=errors)
+    if data is None:
+        # Without metadata there is no release name to file it under. Failing here lets
+        # the scheduler retry a throttled attempt instead of leaving an Unknown_ folder
+        # next to the one the retry creates
+        raise ValueError(errors[-1] if errors else f"Could not read release metadata for {item_url}")
+    release_name = sanitize_folder(data.get("title", ""))
+    real_title = data.get("title", "")
     if not release_name or release_name == "null":
         release_name = f"Unknown_{int(subprocess.getoutput('date +%s'))}"
-    if real_title and real_title != "null":
-        update_albums_txt(output_dir, item_url, real_title)
-    base_folder = os.path.join(output_dir, release_name)
-    target_folder = base_folder
-    suffix = 1
-    while os.path.exists(target_folder):
-        target_folder = f"{base_folder} ({suffix})"
-        suffix += 1
-    os.makedirs(target_folder, exist_ok=True)
-    tracks_txt = os.path.join(target_folder, "tracks.txt")
-    with open(tracks_txt, "w") as f:
-        f.write(f"{release_name}\n{item_url}\n\n")
-        entries = data.get("entries", []) if data else []
-        for i, entry in enumerate(entries, 1):
-            title = entry.get("title", "Unknown Track")
+    STAGING.wait_for_space()
+    # The release is built in staging and only appears in the library when it is
+    # finished, so the folder name is held by the staging area until then
+    target_folder = STAGING.acquire(lambda taken: release_folder(output_dir, release_name, item_url, journal, taken), item_url)
+    try:
+        work = STAGING.folder(target_folder)
+        tracks = []
+        for entry in data.get("entries", []):
             url = entry.get("webpage_url", "")
             if not url:
                 yt_id = entry.get("id") or entry.get("url", "")
                 if yt_id:
                     url = f"https://www.youtube.com/watch?v={yt_id}"
-            f.write(f"{i}. {title}\n{url}\n\n")
-    args = [
-        "yt-dlp",
-        "--yes-playlist",
-        "--ignore-errors",
-        "--extract-audio",
-        "--audio-format", "mp3",
-        "--audio-quality", "0",
-        "--embed-metadata",
-        "--embed-thumbnail",
-        "--concurrent-fragments", "8",
-        "--limit-rate", "2M",
-        "--downloader", "aria2c",
-        "--download-archive", tracks_txt,
-        "--downloader-args", "aria2c:-x16 -s16 -k1M",
-        "--extractor-args", "youtube:player-client=default,-tv_simply",
-        "--output", os.path.join(target_folder, "%(title)s.%(ext)s"),
-        item_url
-    ]
-    if cookie_option and browser != "none":
-        args.insert(1, "--cookies-from-browser")
-        args.insert(2, browser)
-    subprocess.run(args)
+            tracks.append({"id": entry.get("id"), "title": entry.get("title", "Unknown Track"), "url": url, "duration": entry.get("duration")})
+        track_ids = [t["id"] for t in tracks if t["id"]]
+        if "entries" not in data and data.get("id"):
+            track_ids = [data["id"]]
+        if journal:
+            known_ids = journal.release(item_url).get("track_ids")
+            if known_ids is not None:
+                added = len(set(track_ids) - set(known_ids))
+                if added:
+                    print(f"➕ {added} new track(s) in {real_title or release_name}")
+            journal.start_release(item_url, target_folder, real_title or release_name, track_ids)
+        if manifest:
+            fields = {"folder": os.path.basename(target_folder), "tracks": len(tracks), "status": "downloading"}
+            if real_title and real_title != "null":
+                fields["title"] = real_title
+            manifest.update(item_url, **fields)
+        # Staged with the audio, so the tracklist reaches the library together with it
+        write_tracks(work, {"title": release_name, "url": item_url, "tracks": tracks})
+        archive = os.path.join(target_folder, ARCHIVE_NAME)
+        reused = library_tracks(data.get("entries", []), archive)
+        # Tracks of a release share its cover, fetch and convert it once for all of them
+        cover = ARTWORK.get(thumbnail_urls(data)) if data.get("entries") else None
+        def on_complete(final):
+            METRICS.event("release", url=item_url, title=real_title or release_name, ok=final["ok"], tracks=len(tracks),
+                          files=len(final["files"]), reused=len(reused), bytes=final.get("bytes", 0),
+                          seconds=round(time.time() - start, 3), errors=final["errors"][-5:])
+            if journal:
+                journal.finish_release(item_url, final)
+            if manifest:
+                manifest.update(item_url, status="done" if final["ok"] else "failed")
+            if on_finished:
+                on_finished(dict(final, folder=target_folder, title=real_title or release_name, tracks=tracks, track_ids=track_ids))
+        result = fetch_tracks(item_url, target_folder, browser, cookie_option, archive=archive, on_complete=on_complete, cover=cover, owns_folder=True, playlist=True, info=data, reuse=reused)
+    except Exception:
+        # Tracks staged by an earlier attempt stay for the next one
+        STAGING.release(target_folder, keep=True)
+        raise
+    # fetch_tracks holds the folder itself until its files are in the library
+    STAGING.release(target_folder)
+    return result
 
 def download_single_song(url, output_dir, cookie_option, browser):
     print(f"🎵 Downloading single song: {url}")
-    args = [
-        "yt-dlp",
-        "--ignore-errors",
-        "--extract-audio",
-        "--audio-format", "mp3",
-        "--audio-quality", "0",
-        "--embed-metadata",
-        "--embed-thumbnail",
-        "--concurrent-fragments", "8",
-        "--limit-rate", "2M",
-        "--downloader", "aria2c",
-        "--downloader-args", "aria2c:-x16 -s16 -k1M",
-        "--extractor-args", "youtube:player-client=default,-tv_simply",
-        "--output", os.path.join(output_dir, "%(title)s.%(ext)s"),
-        url
-    ]
-    if cookie_option and browser != "none":
-        args.insert(1, "--cookies-from-browser")
-        args.insert(2, browser)
     os.makedirs(output_dir, exist_ok=True)
-    subprocess.run(args)
+    return fetch_tracks(url, output_dir, browser, cookie_option)
 
 def download_single_playlist(url, cookie_option, browser):
     print(f"📃 Downloading playlist: {url}")
     info = run_yt_dlp_json(url, browser, cookies=cookie_option)
     playlist_title = info.get("title", "Unknown_Playlist") if info else "Unknown_Playlist"
-    playlist_folder = os.path.join("output", "playlists", sanitize_folder(playlist_title))
+    playlist_folder = os.path.join(OUTPUT_DIR, "playlists", sanitize_folder(playlist_title))
     os.makedirs(playlist_folder, exist_ok=True)
-    tracks_txt = os.path.join(playlist_folder, "tracks.txt")
     entries = info.get("entries", []) if info else []
-    with open(tracks_txt, "w") as f:
-        f.write(f"{playlist_title}\n{url}\n\n")
-        for i, entry in enumerate(entries, 1):
-            title = entry.get("title", "Unknown Track")
-            track_url = entry.get("webpage_url", "")
-            f.write(f"{i}. {title}\n{track_url}\n\n")
+    tracks = [{"id": e.get("id"), "title": e.get("title", "Unknown Track"), "url": e.get("webpage_url", ""), "duration": e.get("duration")} for e in entries]
+    write_tracks(playlist_folder, {"title": playlist_title, "url": url, "tracks": tracks})
     def download_track(entry):
         track_url = entry.get("url") or entry.get("webpage_url", url)
-        args = [
-            "yt-dlp",
-            "--ignore-errors",
-            "--extract-audio",
-            "--audio-format", "mp3",
-            "--audio-quality", "0",
-            "--embed-metadata",
-            "--embed-thumbnail",
-            "--concurrent-fragments", "8",
-            "--limit-rate", "2M",
-            "--downloader", "aria2c",
-            "--downloader-args", "aria2c:-x16 -s16 -k1M",
-            "--extractor-args", "youtube:player-client=default,-tv_simply",
-            "--output", os.path.join(playlist_folder, "%(title)s.%(ext)s"),
-            track_url
-        ]
-        if cookie_option and browser != "none":
-            args.insert(1, "--cookies-from-browser")
-            args.insert(2, browser)
-        subprocess.run(args)
+        if reuse_library_tracks([entry], playlist_folder):
+            return {"url": track_url, "ok": True, "errors": []}
+        archive = os.path.join(playlist_folder, ARCHIVE_NAME)
+        return fetch_tracks(track_url, playlist_folder, browser, cookie_option, archive=archive)
     if entries:
-        print(f"🚀 Starting parallel download of playlist tracks with 5 jobs...")
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            for entry in entries:
-                executor.submit(download_track, entry)
+        print(f"🚀 Starting parallel download of playlist tracks ({SCHEDULER.describe()})...")
+        futures = [SCHEDULER.submit(entry.get("title") or entry.get("url", url), download_track, entry) for entry in entries]
+        SCHEDULER.wait(futures)
+        TRANSCODER.wait()
         print(f"✅ Playlist downloaded to: {playlist_folder}")
     else:
         print("❌ No tracks found in playlist.")
@@ -437,6 +511,46 @@ def choose_browser():
             return browser
         print("❌ Unsupported browser.")
 
+def choose_settings():
+    global SCHEDULER, TRANSCODER
+    settings = load_settings()
+    print(f"Current limits: {SCHEDULER.describe()}")
+    prompts = [
+        ("max_jobs", "Parallel jobs", int),
+        ("max_connections", "Total connections", int),
+        ("total_rate", "Total bandwidth (e.g. 10M, 0 for unlimited)", str),
+        ("audio_format", "Audio format (mp3, or native to skip re-encoding)", str),
+        ("transcode_workers", "Transcode processes (0 = one per CPU core)", int),
+        ("staging_dir", "Staging folder, e.g. a tmpfs or local SSD (- for <output>/.staging)", str),
+        ("staging_limit", "Staging space limit (e.g. 4G, 0 for unlimited)", str),
+    ]
+    for key, label, cast in prompts:
+        value = input(f"{label} [{settings[key]}]: ").strip()
+        if not value:
+            continue
+        try:
+            if key in ("total_rate", "staging_limit"):
+                parse_rate(value)
+            if key == "staging_dir" and value == "-":
+                value = ""
+            if key == "audio_format" and value not in ("mp3", "native"):
+                raise ValueError(value)
+            settings[key] = cast(value)
+        except ValueError:
+            print(f"❌ Invalid value for {label.lower()}, keeping {settings[key]}.")
+    save_settings(settings)
+    SCHEDULER.shutdown()
+    SCHEDULER = make_scheduler(settings)
+    TRANSCODER.shutdown()
+    TRANSCODER = make_transcoder(settings)
+    configure_staging(settings)
+    return settings
+
+def finish_metrics():
+    # Each menu download gets its own summary
+    METRICS.print_summary()
+    METRICS.reset()
+
 def menu():
     browser = load_browser()
     supported_browsers = ["firefox", "chrome", "edge", "opera", "none"]
@@ -446,76 +560,533 @@ def menu():
         print("\n==== YouTube Downloader ====")
         if browser == "none":
             print("WARNING: To avoid YouTube rate limiting or issues with restricted content, it is STRONGLY RECOMMENDED to set browser cookies.")
-            print("WARNING: Firefox browser is also required for downloading songs from artists with topic channels (web scraping fallback).")
+            print("WARNING: Firefox browser may be required for downloading songs from artists with topic channels (last-resort web scraping fallback).")
         print(f"Current browser for cookies: {browser}")
         print("1. Download all singles/albums of an artist")
         print("2. Download a single song")
         print("3. Download a single playlist")
         print("4. Set browser for cookies")
+        print("5. Set download limits")
         print("0. Exit")
         choice = input("Select an option: ").strip()
         if choice == "1":
             url = input("🔗 Enter the YouTube channel/artist URL: ").strip()
-            print("🔍 Getting channel name...")
-            output_dir_temp = os.path.join("output", "releases", "temp")
-            os.makedirs(output_dir_temp, exist_ok=True)
             print("🔍 Searching for available albums and singles...")
-            urls_result = get_release_urls(url, output_dir_temp, browser)
-            
-            scraped_channel_name = None
-            if isinstance(urls_result, dict):
-                urls = urls_result.get("urls", [])
-                scraped_channel_name = urls_result.get("channel_name")
-            else:
-                urls = urls_result
-            
-            channel_name = get_channel_name(url, browser, scraped_channel_name)
+            channel = ChannelInfo(url=url)
+            releases = iter_release_entries(url, browser, channel)
+            first = next(releases, None)
+            channel_name = get_channel_name(url, browser, channel.name)
             if not channel_name:
                 print("❌ Invalid URL. Unable to determine channel/artist.")
                 continue
             print(f"📺 Channel: {channel_name}")
-            
-            output_dir = os.path.join("output", "releases", channel_name)
-            if output_dir != output_dir_temp:
-                os.makedirs(output_dir, exist_ok=True)
-                import shutil
-                if os.path.exists(os.path.join(output_dir_temp, "albums.txt")):
-                    shutil.move(os.path.join(output_dir_temp, "albums.txt"), os.path.join(output_dir, "albums.txt"))
-                try:
-                    os.rmdir(output_dir_temp)
-                except:
-                    pass
-            
-            num_items = len(urls)
-            print(f"📦 Found {num_items} albums/singles to download.")
-            if num_items == 0:
+            if first is None:
                 print("❌ No content found.")
                 continue
-            print("🚀 Starting parallel download with 5 jobs...")
+            output_dir = os.path.join(OUTPUT_DIR, "releases", channel_name)
+            os.makedirs(output_dir, exist_ok=True)
+            journal = ArtistJournal(output_dir)
+            manifest = ManifestWriter(output_dir, journal=journal)
+            print(f"🚀 Starting parallel download ({SCHEDULER.describe()})...")
             cookie_option = True
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                for idx, item_url in enumerate(urls):
-                    executor.submit(download_release, item_url, idx, output_dir, cookie_option, browser)
+            futures = []
+            changed = 0
+            for release, reason in releases_to_sync(channel, itertools.chain([first], releases), journal, manifest):
+                changed += reason == "changed"
+                futures.append(SCHEDULER.submit(release.url, download_release, release.url, output_dir, cookie_option, browser, journal, manifest))
+            print(f"📦 Found {len(channel.releases)} albums/singles, {len(futures)} to download.")
+            if changed:
+                print(f"➕ {changed} already downloaded release(s) have new tracks.")
+            SCHEDULER.wait(futures)
+            TRANSCODER.wait()
+            manifest.close()
             print(f"✅ Download completed. Files saved in: {output_dir}")
+            finish_metrics()
         elif choice == "2":
             url = input("🔗 Enter the YouTube song URL: ").strip()
-            output_dir = os.path.join("output", "songs")
+            output_dir = os.path.join(OUTPUT_DIR, "songs")
             cookie_option = True
-            download_single_song(url, output_dir, cookie_option, browser)
+            SCHEDULER.wait([SCHEDULER.submit(url, download_single_song, url, output_dir, cookie_option, browser)])
+            TRANSCODER.wait()
             print(f"✅ Song downloaded to: {output_dir}")
+            finish_metrics()
         elif choice == "3":
             url = input("🔗 Enter the YouTube playlist URL: ").strip()
             cookie_option = True
             download_single_playlist(url, cookie_option, browser)
             print(f"✅ Playlist downloaded to: output/playlists/<playlist_name>")
+            finish_metrics()
         elif choice == "4":
             browser = choose_browser()
             print(f"✅ Browser for cookies set to {browser}.")
+        elif choice == "5":
+            choose_settings()
+            print(f"✅ Download limits set to {SCHEDULER.describe()}.")
         elif choice == "0":
+            TRANSCODER.shutdown()
+            close_scraper()
             print("👋 Goodbye!")
             sys.exit(0)
         else:
             print("❌ Invalid choice.")
 
+def bench_engine(urls, browser, rounds=3):
+    print(f"⏱️ Comparing subprocess and in-process extraction over {len(urls)} URL(s), {rounds} round(s)...")
+    report = compare_overhead(ENGINE, urls, browser, rounds)
+    for name, stats in report.items():
+        print(f"{name:>11}: first {stats['first']:.2f}s | mean {stats['mean']:.2f}s/item | total {stats['total']:.2f}s ({stats['items']} items)")
+    sub, inproc = report["subprocess"]["mean"], report["in-process"]["mean"]
+    if inproc > 0:
+        print(f"📉 Per-item overhead saved: {sub - inproc:.2f}s ({sub / inproc:.1f}x)")
+
+def bench_pipeline(args):
+    global SCHEDULER, TRANSCODER
+    from benchmark import FakeYouTube, FakeYoutubeIE, code_version, measure, previous_result, save_result
+    backend = FakeYouTube(args.artists, args.releases, args.tracks, args.playlist_tracks, args.track_seconds,
+                          args.latency, parse_rate(args.bandwidth), args.error_rate).start()
+    workdir = tempfile.mkdtemp(prefix="yt-bench-")
+    set_output_dir(workdir)
+    # The temporary library is removed afterwards, keep the event log only when asked for
+    METRICS.log_path = None
+    prepare_metrics(args)
+    ENGINE.extractors = [FakeYoutubeIE]
+    settings = load_settings()
+    for key in ("max_jobs", "max_connections", "total_rate", "audio_format", "transcode_workers", "staging_dir", "staging_limit"):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+    SCHEDULER.shutdown()
+    SCHEDULER = make_scheduler(settings)
+    TRANSCODER.shutdown()
+    TRANSCODER = make_transcoder(settings)
+    configure_staging(settings)
+    release_urls = {}
+
+    def artist_dir(channel_url):
+        return os.path.join(OUTPUT_DIR, "releases", channel_url.rsplit("@", 1)[1])
+
+    def discover():
+        for url in backend.channel_urls():
+            result = get_release_urls(url, artist_dir(url), "none")
+            release_urls[url] = result["urls"] if isinstance(result, dict) else result
+
+    def download_releases():
+        futures = []
+        for channel_url, urls in release_urls.items():
+            futures += [SCHEDULER.submit(u, download_release, u, artist_dir(channel_url), True, "none") for u in urls]
+        SCHEDULER.wait(futures)
+        TRANSCODER.wait()
+
+    def download_playlist():
+        download_single_playlist(backend.playlist_url(), True, "none")
+
+    scenarios = {"discovery": discover, "releases": download_releases, "playlist": download_playlist}
+    selected = [name for name in scenarios if name in args.scenarios.split(",")]
+    report = {}
+    print(f"⏱️ Benchmarking {', '.join(selected)} against a fake backend at {backend.base_url} ({SCHEDULER.describe()})...")
+    try:
+        if "releases" in selected and "discovery" not in selected:
+            discover()
+        for name in selected:
+            METRICS.reset()
+            report[name] = measure(backend, scenarios[name])
+            report[name]["stages"] = METRICS.snapshot()["stages"]
+    finally:
+        backend.stop()
+        TRANSCODER.shutdown()
+        METRICS.close()
+        if args.keep:
+            print(f"📁 Benchmark library kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    config = dict(backend.config(), scenarios=selected, settings={k: settings[k] for k in DEFAULT_SETTINGS})
+    previous = previous_result(args.results, config)
+    print(f"{'scenario':<10} {'wall':>8} {'tracks/s':>9} {'MB/s':>7} {'peak RSS':>9} {'procs':>6} {'threads':>8} {'429s':>5}")
+    for name, stats in report.items():
+        print(f"{name:<10} {stats['wall']:>7.2f}s {stats['tracks_per_s']:>9.2f} {stats['throughput'] / 1024 ** 2:>7.2f} "
+              f"{stats['peak_rss'] / 1024 ** 2:>7.0f}MB {stats['peak_processes']:>6} {stats['peak_threads']:>8} {stats['errors_injected']:>5}")
+        before = (previous or {}).get("results", {}).get(name)
+        if before and before["wall"]:
+            print(f"{'':<10} vs {previous['version']}: wall {before['wall']:.2f}s -> {stats['wall']:.2f}s ({stats['wall'] / before['wall'] - 1:+.0%})")
+        busy = ", ".join(f"{stage} {v['seconds']:.2f}s" for stage, v in stats["stages"].items())
+        if busy:
+            print(f"{'':<10} busy: {busy}")
+    save_result(args.results, {"time": time.time(), "version": code_version(SCRIPT_DIR), "config": config, "results": report})
+    print(f"📝 Results appended to {args.results}")
+
+def read_url_list(path):
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+class ArtistStates:
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, output_dir):
+        with self._lock:
+            if output_dir not in self._states:
+                os.makedirs(output_dir, exist_ok=True)
+                journal = ArtistJournal(output_dir)
+                self._states[output_dir] = (journal, ManifestWriter(output_dir, journal=journal))
+            return self._states[output_dir]
+
+    def close(self):
+        for journal, manifest in self._states.values():
+            manifest.close()
+
+def library_path(path):
+    return os.path.relpath(path, OUTPUT_DIR)
+
+def last_error(result):
+    return result["errors"][-1] if result.get("errors") else None
+
+def plan_artist(task, attempt, queue, browser, states, full=False):
+    url = task["url"]
+    channel = ChannelInfo(url=url)
+    releases = iter_release_entries(url, browser, channel)
+    first = next(releases, None)
+    channel_name = get_channel_name(url, browser, channel.name)
+    if not channel_name:
+        raise ValueError(f"Unable to determine channel/artist for {url}")
+    output_dir = os.path.join(OUTPUT_DIR, "releases", channel_name)
+    journal, manifest = states.get(output_dir)
+    queued = 0
+    for release, reason in releases_to_sync(channel, itertools.chain([first], releases) if first else [], journal, manifest, full):
+        queue.add("release", release.url, parent=task["id"], payload={"artist_dir": library_path(output_dir), "reason": reason})
+        queued += 1
+    print(f"📺 {channel_name}: {len(channel.releases)} release(s), {queued} queued")
+    attempt.finish(True)
+    return {"url": url, "ok": True, "errors": []}
+
+def plan_playlist(task, attempt, queue, browser):
+    url = task["url"]
+    info = run_yt_dlp_json(url, browser, cookies=True)
+    if not info:
+        raise ValueError(f"Could not read playlist {url}")
+    playlist_title = info.get("title") or "Unknown_Playlist"
+    playlist_folder = os.path.join(OUTPUT_DIR, "playlists", sanitize_folder(playlist_title))
+    entries = info.get("entries") or []
+    tracks = [{"id": e.get("id"), "title": e.get("title", "Unknown Track"), "url": e.get("webpage_url", ""), "duration": e.get("duration")} for e in entries]
+    write_tracks(playlist_folder, {"title": playlist_title, "url": url, "tracks": tracks})
+    for entry in entries:
+        track_url = entry.get("url") or entry.get("webpage_url")
+        if track_url:
+            queue.add("track", track_url, parent=task["id"], payload={
+                "folder": library_path(playlist_folder),
+                "entry": {key: entry.get(key) for key in ("id", "ie_key", "url", "webpage_url", "title")},
+            })
+    print(f"📃 {playlist_title}: {len(entries)} track(s) queued")
+    attempt.finish(True)
+    return {"url": url, "ok": True, "errors": []}
+
+def run_release_task(task, attempt, queue, browser, states=None):
+    output_dir = os.path.join(OUTPUT_DIR, task["payload"]["artist_dir"])
+    journal, manifest = states.get(output_dir) if states else (None, None)
+    def on_finished(final):
+        finished = attempt.finish(final["ok"], last_error(final), {
+            "folder": library_path(final["folder"]),
+            "title": final["title"],
+            "tracks": len(final["tracks"]),
+            "track_ids": final["track_ids"],
+            "errors": final["errors"][-5:],
+            "unavailable": final.get("unavailable", []),
+            "files": [{"id": t.get("id"), "filepath": library_path(t["filepath"])} for t in final["files"]],
+        })
+        if not finished:
+            return
+        for track in final["files"]:
+            queue.add("track", track.get("id") or track["filepath"], parent=task["id"],
+                      payload={"title": track.get("title"), "path": library_path(track["filepath"])}, status=DONE)
+    return download_release(task["url"], output_dir, True, browser, journal, manifest, on_finished)
+
+def run_track_task(task, attempt, browser):
+    folder = os.path.join(OUTPUT_DIR, task["payload"]["folder"])
+    entry = task["payload"]["entry"]
+    if reuse_library_tracks([entry], folder):
+        attempt.finish(True)
+        return {"url": task["url"], "ok": True, "errors": []}
+    def on_complete(final):
+        attempt.finish(final["ok"], last_error(final))
+    return fetch_tracks(task["url"], folder, browser, True, archive=os.path.join(folder, ARCHIVE_NAME), on_complete=on_complete)
+
+def merge_release_result(task, states):
+    # Workers never touch the journal or albums manifest, the coordinator
+    # folds their results in so each artist keeps a single writer
+    output_dir = os.path.join(OUTPUT_DIR, task["payload"]["artist_dir"])
+    journal, manifest = states.get(output_dir)
+    result = task["result"] or {"errors": [task["error"]] if task["error"] else []}
+    ok = task["status"] == DONE
+    if result.get("folder"):
+        folder = os.path.join(OUTPUT_DIR, result["folder"])
+        journal.start_release(task["url"], folder, result["title"], result["track_ids"])
+        manifest.update(task["url"], folder=os.path.basename(folder), tracks=result["tracks"], title=result["title"])
+    files = [dict(f, filepath=os.path.join(OUTPUT_DIR, f["filepath"])) for f in result.get("files", [])]
+    journal.finish_release(task["url"], {"ok": ok, "errors": result.get("errors", []), "files": files,
+                                         "unavailable": result.get("unavailable", [])})
+    manifest.update(task["url"], status="done" if ok else "failed")
+
+class TaskAttempt:
+    # One scheduler attempt at a claimed task. The scheduler retries a throttled
+    # attempt itself, so only the attempt it will not retry may finish the task;
+    # until then the task stays running and the worker's heartbeat keeps its lease
+    def __init__(self, queue, task, number):
+        self.queue = queue
+        self.task = task
+        self.number = number
+        self.retried = None
+        self._decided = threading.Event()
+
+    def decide(self, errors):
+        self.retried = SCHEDULER.will_retry(self.number, errors)
+        self._decided.set()
+
+    def finish(self, ok, error=None, result=None):
+        # A successful attempt is never retried. A failed one may still be running
+        # its handler when transcodes call back, wait for the scheduler's verdict
+        if not ok:
+            self._decided.wait()
+            if self.retried:
+                return False
+        return self.queue.finish(self.task, ok, error, result)
+
+def process_queue(queue, handlers, worker=None, lease=None, on_tick=None):
+    def run_task(task, numbers):
+        attempt = TaskAttempt(queue, task, next(numbers))
+        try:
+            result = handlers[task["kind"]](task, attempt)
+        except Exception as e:
+            attempt.decide([str(e)])
+            attempt.finish(False, str(e))
+            raise
+        attempt.decide(result.get("errors", []) if isinstance(result, dict) else [])
+        return result
+
+    in_flight = {}
+    while True:
+        if on_tick:
+            on_tick()
+        # Claim only what the job slots can start, so the queue reflects what is
+        # really running and other workers can take the rest
+        for task in queue.claim(SCHEDULER.max_jobs - len(in_flight), list(handlers), worker, lease):
+            in_flight[SCHEDULER.submit(task["url"], run_task, task, itertools.count())] = task
+        if not in_flight:
+            TRANSCODER.wait()
+            if not queue.unfinished():
+                break
+            if not queue.pending():
+                # Everything left is held by other processes
+                time.sleep(POLL_SECONDS)
+            continue
+        done, _ = wait(in_flight, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+        for future in done:
+            in_flight.pop(future)
+
+def print_run_summary(queue):
+    counts = queue.counts()
+    summary = []
+    for kind in ("artist", "playlist", "release", "track"):
+        done_count = counts.get((kind, DONE), 0)
+        failed_count = counts.get((kind, FAILED), 0)
+        if done_count or failed_count or kind in ("artist", "release"):
+            summary.append(f"{kind}s: {done_count} done" + (f", {failed_count} failed" if failed_count else ""))
+    print(f"📊 Sync run {queue.run} finished - " + " | ".join(summary))
+    failures = queue.failures()
+    for task in failures:
+        print(f"   ❌ {task['kind']} {task['url']}: {task['error'] or 'unknown error'}")
+    METRICS.print_summary()
+    return not failures
+
+def start_or_resume(queue, artist_urls, playlist_urls=()):
+    if queue.start_run(artist_urls, "artist", [("playlist", url) for url in playlist_urls]):
+        playlists = f" and {len(playlist_urls)} playlist(s)" if playlist_urls else ""
+        print(f"🗂️ Queued {len(artist_urls)} artist(s){playlists} for sync run {queue.run}.")
+    else:
+        print(f"♻️ Resuming sync run {queue.run}: {queue.unfinished()} task(s) left.")
+
+def run_sync(artist_urls, browser, queue, full=False):
+    start_or_resume(queue, artist_urls)
+    states = ArtistStates()
+    print(f"🚀 Starting sync ({SCHEDULER.describe()})...")
+    process_queue(queue, {
+        "artist": lambda task, attempt: plan_artist(task, attempt, queue, browser, states, full),
+        "release": lambda task, attempt: run_release_task(task, attempt, queue, browser, states),
+    })
+    states.close()
+    return print_run_summary(queue)
+
+def run_coordinator(artist_urls, playlist_urls, browser, queue, full=False):
+    start_or_resume(queue, artist_urls, playlist_urls)
+    states = ArtistStates()
+
+    def tick():
+        reclaimed = queue.reclaim_expired()
+        if reclaimed:
+            print(f"⏰ {reclaimed} task(s) lost their worker, requeued.")
+        for task in queue.unmerged(("release",)):
+            try:
+                merge_release_result(task, states)
+            except Exception as e:
+                print(f"⚠️ Could not merge result for {task['url']}: {e}")
+            queue.mark_merged(task["id"])
+
+    print(f"🛰️ Coordinating sync run {queue.run}, waiting for workers on {queue.path}")
+    process_queue(queue, {
+        "artist": lambda task, attempt: plan_artist(task, attempt, queue, browser, states, full),
+        "playlist": lambda task, attempt: plan_playlist(task, attempt, queue, browser),
+    }, on_tick=tick)
+    tick()
+    states.close()
+    return print_run_summary(queue)
+
+def run_worker(queue, browser, worker_id, lease=LEASE_SECONDS, wait_for_run=300):
+    deadline = time.time() + wait_for_run
+    while not (queue.attach() and queue.unfinished()):
+        if time.time() > deadline:
+            print("💤 No unfinished sync run to work on.")
+            return True
+        time.sleep(POLL_SECONDS)
+    print(f"🛠️ Worker {worker_id} joined sync run {queue.run} ({SCHEDULER.describe()})")
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(lease / 3):
+            try:
+                queue.heartbeat(worker_id, lease)
+            except Exception as e:
+                print(f"⚠️ Heartbeat failed: {e}")
+
+    beat = threading.Thread(target=heartbeat, name="heartbeat", daemon=True)
+    beat.start()
+    try:
+        process_queue(queue, {
+            "release": lambda task, attempt: run_release_task(task, attempt, queue, browser),
+            "track": lambda task, attempt: run_track_task(task, attempt, browser),
+        }, worker_id, lease)
+    finally:
+        stop.set()
+        beat.join()
+    print(f"✅ Worker {worker_id} finished, sync run {queue.run} is complete.")
+    METRICS.print_summary()
+    return True
+
+def prepare_metrics(args):
+    if args.metrics_log:
+        METRICS.log_path = None if args.metrics_log == "none" else args.metrics_log
+    if args.metrics_port is not None:
+        METRICS.serve(args.metrics_port)
+
+def prepare_batch(args):
+    global SCHEDULER, SCRAPER_SESSIONS
+    set_output_dir(args.output, args.cache)
+    prepare_metrics(args)
+    if getattr(args, "scraper_sessions", None):
+        SCRAPER_SESSIONS = args.scraper_sessions
+    if args.staging:
+        STAGING.path = args.staging
+    if args.staging_limit is not None:
+        STAGING.limit = parse_rate(args.staging_limit)
+    if getattr(args, "jobs", None):
+        settings = load_settings()
+        settings["max_jobs"] = args.jobs
+        SCHEDULER.shutdown()
+        SCHEDULER = make_scheduler(settings)
+    browser = args.browser or load_browser()
+    if browser not in ("firefox", "chrome", "edge", "opera", "none"):
+        browser = DEFAULT_BROWSER
+    # Shared with the other machines of a run, unlike the caches (--cache)
+    return browser, WorkQueue(args.queue or os.path.join(args.output, ".cache", "queue.sqlite"))
+
+def batch(args):
+    try:
+        artist_urls = read_url_list(args.artists) if getattr(args, "artists", None) else []
+        playlist_urls = read_url_list(args.playlists) if getattr(args, "playlists", None) else []
+    except OSError as e:
+        print(f"❌ Could not read URL list: {e}")
+        return 2
+    browser, queue = prepare_batch(args)
+    try:
+        if args.command == "sync":
+            ok = run_sync(artist_urls, browser, queue, args.full)
+        elif args.command == "coordinator":
+            ok = run_coordinator(artist_urls, playlist_urls, browser, queue, args.full)
+        else:
+            ok = run_worker(queue, browser, args.id or f"{socket.gethostname()}-{os.getpid()}", args.lease, args.wait)
+    finally:
+        TRANSCODER.shutdown()
+        close_scraper()
+        queue.close()
+        METRICS.close()
+    return 0 if ok else 1
+
+def parse_args(argv):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--refresh", action="store_true", default=argparse.SUPPRESS, help="ignore cached metadata for this run")
+    metrics_common = argparse.ArgumentParser(add_help=False)
+    metrics_common.add_argument("--metrics-log", help="JSON-lines event log, or none (default: events.jsonl in the cache folder)")
+    metrics_common.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:<port>/metrics")
+    batch_common = argparse.ArgumentParser(add_help=False, parents=[common, metrics_common])
+    batch_common.add_argument("--output", default=OUTPUT_DIR, help=f"library folder (default: {OUTPUT_DIR})")
+    batch_common.add_argument("--browser", help="browser to read cookies from (default: saved browser)")
+    batch_common.add_argument("--queue", help="work queue database (default: <output>/.cache/queue.sqlite)")
+    batch_common.add_argument("--cache", help="folder for the metadata, library and artwork caches, cookies and event log; keep it on a local disk (default: <output>/.cache)")
+    batch_common.add_argument("--staging", help="folder for in-progress downloads, e.g. a tmpfs or local SSD (default: saved setting or <output>/.staging)")
+    batch_common.add_argument("--staging-limit", help="pause new jobs while staging holds more than this, e.g. 4G or 0 (default: saved setting)")
+    parser = argparse.ArgumentParser(description="Download singles, albums and playlists from YouTube.", parents=[common])
+    commands = parser.add_subparsers(dest="command")
+    sync_parser = commands.add_parser("sync", parents=[batch_common], help="download every artist listed in a file without prompts")
+    sync_parser.add_argument("--artists", required=True, help="text file with one channel/artist URL per line")
+    sync_parser.add_argument("--jobs", type=int, help="parallel jobs shared by all artists (default: saved download limits)")
+    sync_parser.add_argument("--full", action="store_true", help="list every artist's whole discography instead of stopping at already-synced releases")
+    sync_parser.add_argument("--scraper-sessions", type=int, help=f"headless browsers for channels that need scraping (default: {SCRAPER_SESSIONS})")
+    coordinator_parser = commands.add_parser("coordinator", parents=[batch_common], help="plan a sync run for workers and merge their results")
+    coordinator_parser.add_argument("--artists", help="text file with one channel/artist URL per line")
+    coordinator_parser.add_argument("--playlists", help="text file with one playlist URL per line")
+    coordinator_parser.add_argument("--full", action="store_true", help="list every artist's whole discography instead of stopping at already-synced releases")
+    coordinator_parser.add_argument("--scraper-sessions", type=int, help=f"headless browsers for channels that need scraping (default: {SCRAPER_SESSIONS})")
+    worker_parser = commands.add_parser("worker", parents=[batch_common], help="download releases and tracks from a coordinator's queue")
+    worker_parser.add_argument("--jobs", type=int, help="parallel jobs on this worker (default: saved download limits)")
+    worker_parser.add_argument("--id", help="worker name shown in the queue (default: <host>-<pid>)")
+    worker_parser.add_argument("--lease", type=int, default=LEASE_SECONDS, help=f"seconds a task stays reserved without a heartbeat (default: {LEASE_SECONDS})")
+    worker_parser.add_argument("--wait", type=int, default=300, help="seconds to wait for a sync run to appear (default: 300)")
+    pipeline_parser = commands.add_parser("bench", parents=[common, metrics_common], help="measure discovery and downloads against an offline fake YouTube")
+    pipeline_parser.add_argument("--scenarios", default="discovery,releases,playlist", help="comma-separated: discovery, releases, playlist")
+    pipeline_parser.add_argument("--artists", type=int, default=2, help="fake artists (default: 2)")
+    pipeline_parser.add_argument("--releases", type=int, default=3, help="releases per artist (default: 3)")
+    pipeline_parser.add_argument("--tracks", type=int, default=4, help="tracks per release (default: 4)")
+    pipeline_parser.add_argument("--playlist-tracks", type=int, default=8, help="tracks in the playlist scenario (default: 8)")
+    pipeline_parser.add_argument("--track-seconds", type=int, default=30, help="length of every synthetic track (default: 30)")
+    pipeline_parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every request (default: 0.05)")
+    pipeline_parser.add_argument("--bandwidth", default="0", help="per-connection bandwidth cap, e.g. 2M (default: unlimited)")
+    pipeline_parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 429 (default: 0)")
+    pipeline_parser.add_argument("--jobs", dest="max_jobs", type=int, help="override parallel jobs")
+    pipeline_parser.add_argument("--connections", dest="max_connections", type=int, help="override total connections")
+    pipeline_parser.add_argument("--rate", dest="total_rate", help="override total bandwidth, e.g. 10M or 0")
+    pipeline_parser.add_argument("--audio-format", choices=("mp3", "native"), help="override audio format")
+    pipeline_parser.add_argument("--transcode-workers", type=int, help="override transcode processes")
+    pipeline_parser.add_argument("--staging", dest="staging_dir", help="override staging folder (default: inside the benchmark library)")
+    pipeline_parser.add_argument("--staging-limit", help="override staging space limit")
+    pipeline_parser.add_argument("--results", default=os.path.join(CACHE_DIR, "benchmarks.jsonl"), help=f"JSON-lines file results are appended to (default: {CACHE_DIR}/benchmarks.jsonl)")
+    pipeline_parser.add_argument("--keep", action="store_true", help="keep the downloaded benchmark library")
+    bench_parser = commands.add_parser("bench-engine", parents=[common], help="compare subprocess and in-process extraction")
+    bench_parser.add_argument("urls", nargs="+")
+    bench_parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+    if args.command == "coordinator" and not (args.artists or args.playlists):
+        parser.error("coordinator needs --artists and/or --playlists")
+    return args
+
 if __name__ == "__main__":
-    menu()
\ No newline at end of file
+    args = parse_args(sys.argv[1:])
+    if getattr(args, "refresh", False):
+        METADATA_CACHE.refresh = True
+        print("♻️ Ignoring cached metadata for this run.")
+    if args.command == "bench-engine":
+        METADATA_CACHE.refresh = True
+        bench_engine(args.urls, load_browser(), args.rounds)
+    elif args.command == "bench":
+        bench_pipeline(args)
+    elif args.command in ("sync", "coordinator", "worker"):
+        sys.exit(batch(args))
+    else:
+        menu()
@@ -0,0 +1,94 @@
+import json
+import os
+import queue
+import threading
+import time
+from journal import write_atomic, write_json_atomic
+from metrics import METRICS
+
+ALBUMS_JSON = "albums.json"
+ALBUMS_TXT = "albums.txt"
+TRACKS_JSON = "tracks.json"
+TRACKS_TXT = "tracks.txt"
+
+def albums_text(albums):
+    return "".join(f"{idx}. {a.get('title') or 'Unknown'}\n{a['url']}\n\n" for idx, a in enumerate(albums, 1))
+
+def tracks_text(release):
+    lines = [f"{release['title']}\n{release['url']}\n\n"]
+    for idx, track in enumerate(release["tracks"], 1):
+        lines.append(f"{idx}. {track.get('title') or 'Unknown Track'}\n{track.get('url', '')}\n\n")
+    return "".join(lines)
+
+def write_albums(output_dir, albums):
+    os.makedirs(output_dir, exist_ok=True)
+    write_json_atomic(os.path.join(output_dir, ALBUMS_JSON), {"albums": albums})
+    write_atomic(os.path.join(output_dir, ALBUMS_TXT), albums_text(albums))
+
+def write_tracks(folder, release):
+    os.makedirs(folder, exist_ok=True)
+    write_json_atomic(os.path.join(folder, TRACKS_JSON), release)
+    write_atomic(os.path.join(folder, TRACKS_TXT), tracks_text(release))
+
+def load_albums(output_dir):
+    try:
+        with open(os.path.join(output_dir, ALBUMS_JSON), "r") as f:
+            return json.load(f).get("albums", [])
+    except (OSError, ValueError):
+        return []
+
+class ManifestWriter:
+    def __init__(self, output_dir, flush_interval=2.0, journal=None):
+        self.output_dir = output_dir
+        self.journal = journal
+        self.flush_interval = flush_interval
+        self.albums = {a["url"]: a for a in load_albums(output_dir)}
+        self._queue = queue.Queue()
+        self._dirty_albums = False
+        self._thread = threading.Thread(target=self._run, name="manifest-writer", daemon=True)
+        self._thread.start()
+
+    def update(self, url, **fields):
+        self._queue.put((url, fields))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _apply(self, item):
+        url, fields = item
+        album = self.albums.setdefault(url, {"url": url, "title": "Unknown"})
+        album.update(fields)
+        self._dirty_albums = True
+
+    def _flush(self):
+        if self.journal is not None:
+            try:
+                self.journal.flush()
+            except OSError as e:
+                print(f"⚠️ Could not write journal: {e}")
+        if not self._dirty_albums:
+            return
+        with METRICS.timed("manifest", folder=self.output_dir) as span:
+            try:
+                write_albums(self.output_dir, list(self.albums.values()))
+                self._dirty_albums = False
+            except OSError as e:
+                span.update(ok=False, error=str(e))
+                print(f"⚠️ Could not write manifest: {e}")
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                self._flush()
+                return
+            if item:
+                self._apply(item)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.monotonic()
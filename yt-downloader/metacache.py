@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_TTLS = {
+    "channel": 6 * 3600,
+    "playlist": 30 * 24 * 3600,
+    "video": 30 * 24 * 3600,
+}
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def classify_url(url):
+    if "/playlist?list=" in url:
+        return "playlist"
+    if "/watch?v=" in url or "youtu.be/" in url or "/shorts/" in url:
+        return "video"
+    return "channel"
+
+class MetadataCache:
+    def __init__(self, path, ttls=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.refresh = False
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "key TEXT PRIMARY KEY, url TEXT, kind TEXT, data BLOB, size INTEGER, "
+                "created REAL, expires REAL, last_access REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS metadata_url ON metadata (url)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS metadata_access ON metadata (last_access)")
+        return self._db
+
+    def _key(self, url, args):
+        return hashlib.sha1(json.dumps([url, list(args)]).encode("utf-8")).hexdigest()
+
+    def get(self, url, args=()):
+        if self.refresh:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            key = self._key(url, args)
+            row = db.execute("SELECT data, expires FROM metadata WHERE key = ?", (key,)).fetchone()
+            if not row or row[1] < now:
+                if row:
+                    db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+                    db.commit()
+                return None
+            db.execute("UPDATE metadata SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, url, data, args=()):
+        if data is None:
+            return
+        kind = classify_url(url)
+        blob = zlib.compress(json.dumps(data).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(url, args), url, kind, blob, len(blob), now, now + self.ttls[kind], now),
+            )
+            self._evict(db)
+            db.commit()
+
+    def invalidate(self, url=None):
+        with self._lock:
+            db = self._conn()
+            if url is None:
+                db.execute("DELETE FROM metadata")
+            else:
+                db.execute("DELETE FROM metadata WHERE url = ?", (url,))
+            db.commit()
+
+    def _evict(self, db):
+        db.execute("DELETE FROM metadata WHERE expires < ?", (time.time(),))
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM metadata").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = db.execute("SELECT key, size FROM metadata ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,167 @@
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Order of the summary table, roughly the order a release goes through them
+STAGES = ("discovery", "scrape", "extract", "cookies", "download", "transcode", "finalize", "manifest")
+PREFIX = "ytdl"
+
+class Metrics:
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._log = None
+        self._stages = {}
+        self._counters = {}
+        self._server = None
+
+    def _stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = {"count": 0, "failed": 0, "seconds": 0.0, "max": 0.0, "bytes": 0}
+        return self._stages[stage]
+
+    def event(self, kind, **fields):
+        if not self.log_path:
+            return
+        line = json.dumps(dict({"time": round(time.time(), 3), "event": kind, "pid": os.getpid()}, **fields), default=str)
+        with self._lock:
+            try:
+                if self._log is None:
+                    os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                    self._log = open(self.log_path, "a", buffering=1)
+                self._log.write(line + "\n")
+            except OSError as e:
+                # Losing the event log must never stop a download
+                print(f"⚠️ Could not write event log: {e}")
+                self.log_path = None
+
+    def record(self, stage, seconds, ok=True, bytes=0, **fields):
+        with self._lock:
+            stats = self._stage(stage)
+            stats["count"] += 1
+            stats["failed"] += not ok
+            stats["seconds"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["bytes"] += bytes or 0
+        self.event(stage, seconds=round(seconds, 3), ok=ok, bytes=bytes or 0, **fields)
+
+    @contextmanager
+    def timed(self, stage, **fields):
+        # The caller can fill in bytes, ok or extra fields while the stage runs
+        span = dict(fields, ok=True, bytes=0)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span["ok"] = False
+            span.setdefault("error", str(e))
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, **span)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {stage: dict(stats) for stage, stats in self._stages.items()},
+                "counters": dict(self._counters),
+                "uptime": time.time() - self.started,
+            }
+
+    def prometheus_text(self):
+        data = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{PREFIX}_{name}{{{label_text}}} {value}" if label_text else f"{PREFIX}_{name} {value}")
+
+        stages = sorted(data["stages"].items())
+        metric("stage_seconds_total", "counter", "Time spent in each pipeline stage, summed over all jobs.",
+               [({"stage": s}, round(v["seconds"], 3)) for s, v in stages])
+        metric("stage_operations_total", "counter", "Operations finished per pipeline stage and outcome.",
+               [({"stage": s, "outcome": "ok"}, v["count"] - v["failed"]) for s, v in stages]
+               + [({"stage": s, "outcome": "failed"}, v["failed"]) for s, v in stages])
+        metric("stage_bytes_total", "counter", "Bytes transferred or written per pipeline stage.",
+               [({"stage": s}, v["bytes"]) for s, v in stages])
+        metric("events_total", "counter", "Retries, cache hits and other counted events.",
+               [({"name": name}, value) for name, value in sorted(data["counters"].items())])
+        metric("uptime_seconds", "gauge", "Seconds since the process started.", [({}, round(data["uptime"], 1))])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.metrics = self
+        threading.Thread(target=self._server.serve_forever, name="metrics-endpoint", daemon=True).start()
+        print(f"📈 Prometheus metrics on http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server.server_address[1]
+
+    def summary(self):
+        data = self.snapshot()
+        wall = data["uptime"]
+        lines = [f"{'stage':<10} {'ops':>6} {'failed':>7} {'busy':>9} {'mean':>7} {'max':>7} {'MB':>8} {'of wall':>8}"]
+        names = [s for s in STAGES if s in data["stages"]] + sorted(set(data["stages"]) - set(STAGES))
+        for stage in names:
+            v = data["stages"][stage]
+            mean = v["seconds"] / v["count"] if v["count"] else 0
+            # Stages run in parallel, so busy time can exceed the wall time
+            share = v["seconds"] / wall if wall else 0
+            lines.append(f"{stage:<10} {v['count']:>6} {v['failed']:>7} {v['seconds']:>8.1f}s {mean:>6.2f}s "
+                         f"{v['max']:>6.2f}s {v['bytes'] / 1024 ** 2:>8.1f} {share:>8.0%}")
+        if data["counters"]:
+            lines.append(" | ".join(f"{name}: {value}" for name, value in sorted(data["counters"].items())))
+        lines.append(f"wall time {wall:.1f}s on {socket.gethostname()}")
+        return "\n".join(lines)
+
+    def print_summary(self):
+        if not self._stages:
+            return
+        print("⏱️ Time per stage:")
+        print(self.summary())
+        self.event("summary", **self.snapshot())
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+            self.started = time.time()
+
+    def close(self):
+        # Outside the lock: a scrape in progress needs it to finish
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+METRICS = Metrics()
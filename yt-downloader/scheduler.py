@@ -0,0 +1,126 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import METRICS
+from throttle import AdaptiveLimiter, is_throttle_error
+
+MAX_FRAGMENTS_PER_JOB = 8
+MAX_THROTTLE_RETRIES = 3
+
+def parse_rate(value):
+    if value in (None, "", 0, "0"):
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)i?[bB]?\s*", str(value))
+    if not m:
+        raise ValueError(f"Invalid rate: {value}")
+    factor = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[m.group(2).lower()]
+    return int(float(m.group(1)) * factor)
+
+def format_rate(rate):
+    if not rate:
+        return "unlimited"
+    for unit, factor in (("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if rate >= factor:
+            return f"{rate / factor:.1f}{unit}/s"
+    return f"{rate}B/s"
+
+class TokenBucket:
+    # One bandwidth budget drawn from by every running download: callers take what
+    # they just received and sleep off whatever overdraws the bucket
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        # A quarter second of credit, so a burst never runs far past the budget
+        self.burst = burst or rate / 4
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate or amount <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+        return wait
+
+class DownloadScheduler:
+    def __init__(self, max_jobs=5, max_connections=40, total_rate=0, limiter=None):
+        self.max_jobs = max(1, int(max_jobs))
+        self.max_connections = max(1, int(max_connections))
+        self.total_rate = parse_rate(total_rate)
+        self.limiter = limiter or AdaptiveLimiter(self.max_jobs)
+        self.bandwidth = TokenBucket(self.total_rate)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_jobs)
+
+    def current_limits(self):
+        # Each job slot owns a fixed share of the connections, so even max_jobs
+        # downloads at once stay inside the budget. The rate is not split at all:
+        # every download draws from the one bucket, whatever else is running
+        connections = max(1, self.max_connections // self.max_jobs)
+        return {"bandwidth": self.bandwidth, "fragments": min(connections, MAX_FRAGMENTS_PER_JOB)}
+
+    def _attempt(self, label, fn, args, kwargs):
+        self.limiter.acquire()
+        start = time.time()
+        outcome = {"label": label, "ok": False, "errors": [], "bytes": 0, "download_seconds": 0.0, "skipped": 0}
+        try:
+            result = fn(*args, **kwargs)
+            if isinstance(result, dict):
+                outcome["ok"] = result.get("ok", True)
+                outcome["errors"] = result.get("errors", [])
+                outcome["bytes"] = result.get("bytes", 0)
+                outcome["download_seconds"] = result.get("download_seconds", 0.0)
+                outcome["skipped"] = result.get("skipped", 0)
+            else:
+                outcome["ok"] = result is not False
+        except Exception as e:
+            outcome["errors"] = [str(e)]
+        finally:
+            self.limiter.release()
+        outcome["seconds"] = time.time() - start
+        outcome["status"] = self.limiter.record(outcome["ok"], outcome["errors"], outcome["bytes"], outcome["download_seconds"], outcome["skipped"])
+        return outcome
+
+    def will_retry(self, attempt, errors):
+        # attempt counts from 0; the limiter reports every throttle error as "throttled"
+        return attempt < MAX_THROTTLE_RETRIES and is_throttle_error(errors)
+
+    def _run(self, label, fn, args, kwargs):
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            outcome = self._attempt(label, fn, args, kwargs)
+            if not self.will_retry(attempt, outcome["errors"]):
+                break
+            METRICS.count("throttle_requeues")
+            print(f"🔁 Requeueing throttled job: {label}")
+        outcome["attempts"] = attempt + 1
+        METRICS.event("job", label=label, ok=outcome["ok"], attempts=outcome["attempts"], seconds=round(outcome["seconds"], 3),
+                      bytes=outcome["bytes"], status=outcome["status"], error=outcome["errors"][-1] if outcome["errors"] else None)
+        return outcome
+
+    def submit(self, label, fn, *args, **kwargs):
+        return self._executor.submit(self._run, label, fn, args, kwargs)
+
+    def wait(self, futures):
+        outcomes = [future.result() for future in futures]
+        failed = [o for o in outcomes if not o["ok"]]
+        print(f"📊 {len(outcomes) - len(failed)} succeeded, {len(failed)} failed")
+        for outcome in failed:
+            reason = outcome["errors"][-1] if outcome["errors"] else "unknown error"
+            print(f"   ❌ {outcome['label']}: {reason}")
+        return outcomes
+
+    def describe(self):
+        return f"{self.limiter.limit}/{self.max_jobs} jobs, {self.max_connections} connections, {format_rate(self.total_rate)} total"
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
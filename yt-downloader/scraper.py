@@ -0,0 +1,271 @@
+import threading
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from discovery import USER_AGENT, clean_channel_name
+from metrics import METRICS
+
+WARMUP_URL = "https://www.youtube.com/"
+CONSENT_BUTTONS = [
+    "//button[contains(text(), 'Accept all')]",
+    "//button[contains(text(), 'I agree')]",
+    "//button[contains(text(), 'Accetta tutto')]",
+    "//button[contains(text(), 'Reject all')]",
+    "//button[contains(text(), 'Rifiuta tutto')]",
+    "//form[@action='https://consent.youtube.com/save']//button[1]",
+    "//button[@aria-label='Accept all']",
+    "//button[@aria-label='Reject all']",
+]
+# One union query instead of waiting on every variant in turn
+CONSENT_XPATH = " | ".join(CONSENT_BUTTONS)
+CHANNEL_NAME_XPATH = "//html/body/ytd-app/div[1]/ytd-page-manager/ytd-browse/div[4]/ytd-tabbed-page-header/div/div[2]/yt-page-header-renderer/yt-page-header-view-model/div/div[1]/div/yt-dynamic-text-view-model/h1/span"
+SHOW_ALL_XPATH = "//html/body/ytd-app/div[1]/ytd-page-manager/ytd-browse/ytd-two-column-browse-results-renderer/div[1]/ytd-section-list-renderer/div[2]/ytd-item-section-renderer/div[3]/ytd-shelf-renderer/div[1]/div[1]/div/div[3]/ytd-menu-renderer/div[1]/ytd-button-renderer/yt-button-shape/button"
+CONSENT_TIMEOUT = 5
+IDLE_SECONDS = 1.0
+SETTLE_TIMEOUT = 10
+MAX_SCROLLS = 20
+
+# Resolves once no element has been added for idleMs (or after timeoutMs at the latest)
+# and returns how many links the page has by then. With scroll set, the page is scrolled
+# only after the observer is in place, so nothing loaded by the scroll is missed.
+IDLE_JS = """
+const [idleMs, timeoutMs, scroll, done] = arguments;
+let idle, cap;
+const finish = () => {
+    observer.disconnect();
+    clearTimeout(idle);
+    clearTimeout(cap);
+    done({links: document.querySelectorAll('a[href]').length, height: document.documentElement.scrollHeight});
+};
+const observer = new MutationObserver(mutations => {
+    if (mutations.some(m => [...m.addedNodes].some(n => n.nodeType === Node.ELEMENT_NODE))) {
+        clearTimeout(idle);
+        idle = setTimeout(finish, idleMs);
+    }
+});
+observer.observe(document.documentElement, {childList: true, subtree: true});
+idle = setTimeout(finish, idleMs);
+cap = setTimeout(finish, timeoutMs);
+if (scroll) {
+    window.scrollTo(0, document.documentElement.scrollHeight);
+}
+"""
+LINKS_JS = """
+const allLinks = [...document.querySelectorAll('a[href]')]
+    .map(a => a.href)
+    .filter(href => href && (href.includes('/playlist?list=') || href.includes('/watch?v=')))
+    .filter(href => !href.includes('music.youtube.com'))
+    .filter(href => !href.includes('youtube.com/shorts'))
+    .map(href => {
+        try {
+            const url = new URL(href);
+            if (url.pathname.includes('/playlist')) {
+                const listId = url.searchParams.get('list');
+                return listId ? `https://www.youtube.com/playlist?list=${listId}` : null;
+            } else if (url.pathname.includes('/watch')) {
+                const videoId = url.searchParams.get('v');
+                const listId = url.searchParams.get('list');
+                if (videoId && listId) {
+                    return `https://www.youtube.com/playlist?list=${listId}`;
+                } else if (videoId) {
+                    return `https://www.youtube.com/watch?v=${videoId}`;
+                }
+            }
+            return null;
+        } catch (e) {
+            return null;
+        }
+    })
+    .filter(href => href !== null)
+    .filter((href, index, array) => array.indexOf(href) === index);
+return allLinks;
+"""
+
+def firefox_driver():
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument(f"--user-agent={USER_AGENT}")
+    options.set_preference("dom.webdriver.enabled", False)
+    options.set_preference("useAutomationExtension", False)
+    return webdriver.Firefox(options=options)
+
+def wait_for_idle(driver, idle=IDLE_SECONDS, timeout=SETTLE_TIMEOUT, scroll=False):
+    driver.set_script_timeout(timeout + 5)
+    return driver.execute_async_script(IDLE_JS, int(idle * 1000), int(timeout * 1000), scroll)
+
+def accept_consent(driver, timeout=0):
+    if timeout:
+        try:
+            button = WebDriverWait(driver, timeout).until(EC.element_to_be_clickable((By.XPATH, CONSENT_XPATH)))
+        except WebDriverException:
+            return False
+    else:
+        buttons = driver.find_elements(By.XPATH, CONSENT_XPATH)
+        if not buttons:
+            return False
+        button = buttons[0]
+    button.click()
+    try:
+        # The consent page navigates away once the choice is saved
+        WebDriverWait(driver, CONSENT_TIMEOUT).until(EC.staleness_of(button))
+    except WebDriverException:
+        pass
+    return True
+
+def channel_name_from_driver(driver):
+    elements = driver.find_elements(By.XPATH, CHANNEL_NAME_XPATH)
+    return clean_channel_name(elements[0].text if elements else None)
+
+def expand_shelf(driver):
+    buttons = driver.find_elements(By.XPATH, SHOW_ALL_XPATH)
+    if not buttons:
+        return False
+    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", buttons[0])
+    try:
+        buttons[0].click()
+    except WebDriverException:
+        driver.execute_script("arguments[0].click();", buttons[0])
+    wait_for_idle(driver)
+    return True
+
+def scroll_until_stable(driver, max_scrolls=MAX_SCROLLS):
+    state = wait_for_idle(driver)
+    for _ in range(max_scrolls):
+        grown = wait_for_idle(driver, scroll=True)
+        # Nothing new after a scroll means the shelf is fully loaded
+        if grown["links"] <= state["links"] and grown["height"] <= state["height"]:
+            break
+        state = grown
+    return state["links"]
+
+def filter_links(links):
+    filtered_links = []
+    seen_playlists = set()
+    seen_videos = set()
+    seen_video_playlist_pairs = set()
+    for link in links:
+        if '/playlist?list=' in link:
+            playlist_id = link.split('list=')[1].split('&')[0]
+            if playlist_id not in seen_playlists and len(playlist_id) > 10:
+                seen_playlists.add(playlist_id)
+                filtered_links.append({"url": link, "title": "Unknown"})
+        elif '/watch?v=' in link:
+            if '&list=' in link:
+                video_id = link.split('v=')[1].split('&')[0]
+                playlist_id = link.split('list=')[1].split('&')[0]
+                pair = f"{video_id}:{playlist_id}"
+                if pair not in seen_video_playlist_pairs and len(video_id) == 11 and len(playlist_id) > 10:
+                    seen_video_playlist_pairs.add(pair)
+                    playlist_url = f"https://www.youtube.com/playlist?list={playlist_id}"
+                    if playlist_id not in seen_playlists:
+                        seen_playlists.add(playlist_id)
+                        filtered_links.append({"url": playlist_url, "title": "Unknown"})
+            else:
+                video_id = link.split('v=')[1].split('&')[0]
+                if video_id not in seen_videos and len(video_id) == 11:
+                    seen_videos.add(video_id)
+                    filtered_links.append({"url": link, "title": "Unknown"})
+    return filtered_links
+
+def scrape_channel(driver, channel_url):
+    driver.get(channel_url)
+    # Warm sessions have consent already, this only triggers if it expired
+    accept_consent(driver)
+    wait_for_idle(driver)
+    channel_name = channel_name_from_driver(driver)
+    if channel_name:
+        print(f"✅ Extracted channel name from page: {channel_name}")
+    else:
+        print("⚠️ Could not extract channel name from page")
+    expand_shelf(driver)
+    scroll_until_stable(driver)
+    result = {"links": filter_links(driver.execute_script(LINKS_JS))}
+    if channel_name:
+        result["channel_name"] = channel_name
+    return result
+
+class ScraperPool:
+    def __init__(self, size=2, driver_factory=firefox_driver, warmup_url=WARMUP_URL):
+        self.size = max(1, size)
+        self.driver_factory = driver_factory
+        self.warmup_url = warmup_url
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created = 0
+
+    def _new_driver(self):
+        driver = self.driver_factory()
+        try:
+            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+            if self.warmup_url:
+                # Accept consent once per session, the cookie covers every later channel
+                driver.get(self.warmup_url)
+                accept_consent(driver, CONSENT_TIMEOUT)
+        except Exception:
+            driver.quit()
+            raise
+        return driver
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self._new_driver()
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, driver):
+        with self._cond:
+            if driver is None:
+                self._created -= 1
+            else:
+                self._idle.append(driver)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        driver = self._checkout()
+        try:
+            yield driver
+        except WebDriverException:
+            # A crashed or wedged browser is not worth reusing, the next caller gets a fresh one
+            self._release(None)
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            raise
+        except BaseException:
+            self._release(driver)
+            raise
+        self._release(driver)
+
+    def scrape(self, channel_url):
+        with METRICS.timed("scrape", url=channel_url) as span:
+            with self.session() as driver:
+                result = scrape_channel(driver, channel_url)
+            span["links"] = len(result["links"])
+            return result
+
+    def close(self):
+        with self._cond:
+            drivers, self._idle = self._idle, []
+            self._created -= len(drivers)
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
@@ -0,0 +1,219 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from metrics import METRICS
+
+# Left behind by interrupted downloads/transcodes, never worth moving into the library
+PARTIAL_SUFFIXES = (".part", ".ytdl", ".tmp", ".temp")
+STALE_SECONDS = 12 * 3600
+POLL_SECONDS = 1
+# Finished tracks of a release that is still in staging, one JSON line each
+STAGED_NAME = "staged.jsonl"
+
+def tree_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def is_partial(name):
+    return name.endswith(PARTIAL_SUFFIXES) or ".part-Frag" in name
+
+def sibling_tmp(dst):
+    return os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{uuid.uuid4().hex[:8]}.tmp")
+
+def move_file(src, dst):
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Across filesystems (tmpfs -> library): copy next to the target, then swap it in
+    tmp = sibling_tmp(dst)
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.remove(src)
+
+def move_tree(src, dst):
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp = sibling_tmp(dst)
+    try:
+        shutil.copytree(src, tmp)
+        os.rename(tmp, dst)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(src, ignore_errors=True)
+
+class StagingArea:
+    def __init__(self, path, limit=0):
+        self.path = path
+        self.limit = limit
+        self._cond = threading.Condition()
+        self._users = {}
+        self._owners = {}
+        self._keep = set()
+        self._cleaned = None
+
+    def folder(self, target):
+        key = hashlib.sha1(os.path.abspath(target).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.path, key)
+
+    def downloads(self, target):
+        # Raw downloads sit apart from the finished files, in native mode both have the same names
+        return self.folder(target) + "-dl"
+
+    def stage_track(self, target, track, dest):
+        # Kept with the raw downloads, which never move into the library: a later
+        # attempt at the release (after a crash or a failed finalize) picks these
+        # files up instead of downloading them again
+        record = {"id": track.get("id"), "title": track.get("title"), "archive_id": track.get("archive_id"),
+                  "file": os.path.basename(dest)}
+        try:
+            with open(os.path.join(self.downloads(target), STAGED_NAME), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            # The release was finalized (and its staging removed) in the meantime
+            pass
+
+    def staged(self, target):
+        tracks = []
+        try:
+            with open(os.path.join(self.downloads(target), STAGED_NAME), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        track = json.loads(line)
+                    except ValueError:
+                        continue
+                    if os.path.isfile(os.path.join(self.folder(target), track["file"])):
+                        tracks.append(track)
+        except OSError:
+            pass
+        return tracks
+
+    def _clean_stale(self):
+        # Once per staging folder: drop what crashed runs left behind. Only old
+        # entries, other processes may be staging into the same folder right now
+        if self._cleaned == self.path:
+            return
+        self._cleaned = self.path
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        cutoff = time.time() - STALE_SECONDS
+        active = {os.path.basename(f(t)) for t in self._users for f in (self.folder, self.downloads)}
+        for name in names:
+            entry = os.path.join(self.path, name)
+            try:
+                if name in active or os.path.getmtime(entry) > cutoff:
+                    continue
+            except OSError:
+                continue
+            print(f"🧹 Removing stale staging folder {entry}")
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def acquire(self, target, owner=None):
+        # target can be a function picking a folder name that no running job
+        # has claimed yet, chosen and claimed under the same lock. A retry of the
+        # same owner (release URL) waits until the earlier attempt's files are in
+        # the library, then finds its folder there instead of picking "Name (1)"
+        with self._cond:
+            self._clean_stale()
+            while owner in self._owners:
+                self._cond.wait()
+            if callable(target):
+                target = target(set(self._users))
+            self._users[target] = self._users.get(target, 0) + 1
+            if owner is not None:
+                self._owners[owner] = target
+            os.makedirs(self.folder(target), exist_ok=True)
+            os.makedirs(self.downloads(target), exist_ok=True)
+        return target
+
+    def release(self, target, keep=False):
+        # keep: the job did not finish, leave its finished tracks and partial
+        # downloads for the next attempt (stale cleanup removes them eventually)
+        with self._cond:
+            self._users[target] -= 1
+            if keep:
+                self._keep.add(target)
+            if self._users[target]:
+                return
+            del self._users[target]
+            for owner in [o for o, t in self._owners.items() if t == target]:
+                del self._owners[owner]
+            if target in self._keep:
+                self._keep.discard(target)
+            else:
+                # Whatever is still here belongs to failed tracks
+                shutil.rmtree(self.folder(target), ignore_errors=True)
+                shutil.rmtree(self.downloads(target), ignore_errors=True)
+            self._cond.notify_all()
+
+    def wait_for_space(self):
+        if not self.limit:
+            return
+        announced = False
+        with self._cond:
+            # Running jobs free space as their releases are finalized; with nothing
+            # running there is nothing to wait for
+            while self._users and tree_size(self.path) >= self.limit:
+                if not announced:
+                    print(f"⏳ Staging folder {self.path} is full, waiting for running jobs to finish...")
+                    announced = True
+                self._cond.wait(POLL_SECONDS)
+
+    def finalize(self, target, files=None):
+        # files=None moves the whole staging folder (a job that owns it), otherwise
+        # only the given files (jobs sharing one folder, e.g. playlist tracks)
+        work = self.folder(target)
+        moved = {}
+        with METRICS.timed("finalize", folder=target) as span:
+            if files is None:
+                names = []
+                for name in os.listdir(work):
+                    if is_partial(name):
+                        os.remove(os.path.join(work, name))
+                    else:
+                        names.append(name)
+                if not os.path.exists(target):
+                    try:
+                        # A new release shows up in the library in one step
+                        move_tree(work, target)
+                        span["files"] = len(names)
+                        return {os.path.join(work, n): os.path.join(target, n) for n in names}
+                    except OSError as e:
+                        if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                            raise
+                files = [os.path.join(work, n) for n in names]
+            os.makedirs(target, exist_ok=True)
+            for src in files:
+                if not os.path.isfile(src) or is_partial(src):
+                    continue
+                dst = os.path.join(target, os.path.basename(src))
+                move_file(src, dst)
+                moved[src] = dst
+            span["files"] = len(moved)
+        return moved
@@ -0,0 +1,106 @@
+import random
+import re
+import threading
+import time
+from metrics import METRICS
+
+THROTTLE_PATTERNS = [
+    r"HTTP Error 429",
+    r"Too Many Requests",
+    r"sign in to confirm you.?re not a bot",
+    r"confirm you.?re not a bot",
+    r"rate.?limit",
+    r"This content isn.?t available, try again later",
+]
+THROTTLE_RE = re.compile("|".join(THROTTLE_PATTERNS), re.IGNORECASE)
+# Smaller downloads are mostly request latency, their rate says nothing about throughput
+MIN_SAMPLE_BYTES = 1024 * 1024
+
+def is_throttle_error(messages):
+    return any(THROTTLE_RE.search(msg) for msg in messages)
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit, min_limit=1, increase_after=3, base_delay=5.0, max_delay=300.0,
+                 collapse_ratio=0.2, clock=time.monotonic, rng=random.random):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.increase_after = increase_after
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.collapse_ratio = collapse_ratio
+        self.clock = clock
+        self.rng = rng
+        self.running = 0
+        self.throttle_streak = 0
+        self.successes = 0
+        self.backoff_until = 0.0
+        self.throughput = None
+        self._cond = threading.Condition()
+
+    def _ready(self):
+        return self.running < self.limit and self.clock() >= self.backoff_until
+
+    def acquire(self):
+        with self._cond:
+            while not self._ready():
+                wait = self.backoff_until - self.clock()
+                self._cond.wait(timeout=wait if wait > 0 else None)
+            self.running += 1
+
+    def release(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify_all()
+
+    def _decrease(self, reason):
+        if self.clock() < self.backoff_until:
+            # Failures from jobs that started before the last backoff count once
+            return
+        old = self.limit
+        self.limit = max(self.min_limit, self.limit // 2)
+        self.successes = 0
+        self.throttle_streak += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.throttle_streak - 1))
+        # Jitter keeps the workers from all retrying at the same instant
+        delay = delay / 2 + self.rng() * delay / 2
+        self.backoff_until = max(self.backoff_until, self.clock() + delay)
+        METRICS.event("parallelism", reason=reason, old=old, new=self.limit, backoff=round(delay, 1))
+        print(f"🐢 {reason}: parallelism {old} → {self.limit}, backing off {delay:.1f}s")
+        self._cond.notify_all()
+
+    def _increase(self):
+        self.successes += 1
+        if self.successes < self.increase_after or self.limit >= self.max_limit:
+            return
+        old = self.limit
+        self.limit += 1
+        self.successes = 0
+        METRICS.event("parallelism", reason="recovered", old=old, new=self.limit, backoff=0)
+        print(f"🐇 Downloads healthy again: parallelism {old} → {self.limit}")
+        self._cond.notify_all()
+
+    def record(self, ok, errors=(), nbytes=0, seconds=0.0, skipped=0):
+        # seconds: time spent receiving the nbytes, not the job's wall time. Jobs that
+        # skipped tracks (resumed or incremental releases) are left out of the average
+        with self._cond:
+            if is_throttle_error(errors):
+                self._decrease("YouTube is throttling")
+                return "throttled"
+            if not ok:
+                return "failed"
+            self.throttle_streak = 0
+            if nbytes >= MIN_SAMPLE_BYTES and seconds > 0 and not skipped:
+                rate = nbytes / seconds
+                if self.throughput and rate < self.throughput * self.collapse_ratio:
+                    self.throughput = 0.7 * self.throughput + 0.3 * rate
+                    self._decrease("Throughput collapsed")
+                    return "slow"
+                self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+            self._increase()
+            return "ok"
+
+    def record_errors(self, errors):
+        if is_throttle_error(errors):
+            with self._cond:
+                self._decrease("YouTube is throttling")
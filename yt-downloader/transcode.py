@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from metrics import METRICS
+
+# Workers forked straight from this (threaded) process would inherit the pipes of
+# subprocesses other threads are starting at that moment, and those never see EOF
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+NATIVE_EXTS = {"m4a": "m4a", "mp4": "m4a", "webm": "opus", "opus": "opus", "ogg": "ogg", "mp3": "mp3"}
+METADATA_FIELDS = ("title", "artist", "album", "album_artist", "track", "date", "comment")
+# Threads moving finished releases into the library, off the process pool's own thread
+FINALIZE_WORKERS = 2
+
+def output_path(job):
+    base = os.path.splitext(os.path.basename(job["src"]))[0]
+    if job["mode"] == "native":
+        ext = os.path.splitext(job["src"])[1].lstrip(".").lower()
+        return os.path.join(job["dest_dir"], f"{base}.{NATIVE_EXTS.get(ext, ext)}")
+    return os.path.join(job["dest_dir"], f"{base}.mp3")
+
+def ffmpeg_args(job, dest, tmp):
+    ext = os.path.splitext(dest)[1].lstrip(".")
+    thumbnail = job.get("thumbnail")
+    # Ogg/Opus cannot carry a cover stream through ffmpeg, keep the cover only where it fits
+    if ext in ("opus", "ogg"):
+        thumbnail = None
+    args = ["ffmpeg", "-y", "-loglevel", "error", "-i", job["src"]]
+    if thumbnail:
+        args += ["-i", thumbnail]
+    args += ["-map", "0:a"]
+    if thumbnail:
+        # Covers come from the artwork cache already as JPEG, embed them as they are
+        codec = "copy" if thumbnail.lower().endswith((".jpg", ".jpeg")) else "mjpeg"
+        args += ["-map", "1:v", "-c:v", codec, "-disposition:v:0", "attached_pic",
+                 "-metadata:s:v", "title=Album cover", "-metadata:s:v", "comment=Cover (front)"]
+    if ext == "mp3":
+        args += ["-c:a", "libmp3lame", "-q:a", "0", "-id3v2_version", "3", "-f", "mp3"]
+    else:
+        args += ["-c:a", "copy", "-f", {"m4a": "ipod", "opus": "opus", "ogg": "ogg"}.get(ext, ext)]
+    for key in METADATA_FIELDS:
+        value = job.get("metadata", {}).get(key)
+        if value:
+            args += ["-metadata", f"{key}={value}"]
+    return args + [tmp]
+
+def transcode_file(job):
+    dest = output_path(job)
+    tmp = dest + ".part"
+    start = time.perf_counter()
+    os.makedirs(job["dest_dir"], exist_ok=True)
+    try:
+        subprocess.run(ffmpeg_args(job, dest, tmp), check=True, capture_output=True, text=True)
+        os.replace(tmp, dest)
+    except (subprocess.CalledProcessError, OSError) as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        error = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) and e.stderr else str(e)
+        return {"ok": False, "src": job["src"], "dest": dest, "error": error, "seconds": time.perf_counter() - start, "bytes": 0}
+    try:
+        os.remove(job["src"])
+    except OSError:
+        pass
+    return {"ok": True, "src": job["src"], "dest": dest, "error": None, "seconds": time.perf_counter() - start, "bytes": os.path.getsize(dest)}
+
+class Transcoder:
+    def __init__(self, workers=0, mode="mp3"):
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self._executor = None
+        self._finalizer = None
+        self._lock = threading.Lock()
+        self._futures = []
+        self._finalizers = 0
+        self._idle = threading.Condition(self._lock)
+        self.failed = []
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(START_METHOD) if START_METHOD else None
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def _finalize_pool(self):
+        with self._lock:
+            if self._finalizer is None:
+                self._finalizer = ThreadPoolExecutor(max_workers=FINALIZE_WORKERS, thread_name_prefix="finalize")
+            return self._finalizer
+
+    def submit(self, src, dest_dir, metadata=None, thumbnail=None):
+        job = {"src": src, "dest_dir": dest_dir, "metadata": metadata or {}, "thumbnail": thumbnail, "mode": self.mode}
+        future = self._pool().submit(transcode_file, job)
+        future.add_done_callback(self._record)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def _record(self, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"ok": False, "src": "?", "dest": None, "error": str(e)}
+        # Timed in the worker process, recorded here where the metrics live
+        METRICS.record("transcode", result.get("seconds", 0.0), result["ok"], result.get("bytes", 0),
+                       file=os.path.basename(result["src"]), mode=self.mode, error=result["error"])
+        if not result["ok"]:
+            with self._lock:
+                self.failed.append(result)
+            print(f"❌ Transcode failed for {os.path.basename(result['src'])}: {result['error']}")
+
+    def after(self, futures, callback):
+        futures = list(futures)
+        with self._lock:
+            self._finalizers += 1
+            remaining = [len(futures)]
+
+        def run_callback():
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Could not finalize transcoded files: {e}")
+            finally:
+                with self._lock:
+                    self._finalizers -= 1
+                    self._idle.notify_all()
+
+        def done(_):
+            # Runs on the process pool's management thread, which also collects every
+            # other transcode result, so the callback's library I/O goes elsewhere
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._finalize_pool().submit(run_callback)
+
+        if not futures:
+            self._finalize_pool().submit(run_callback)
+        for future in futures:
+            future.add_done_callback(done)
+
+    def wait(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+        pending = sum(1 for f in futures if not f.done())
+        if pending:
+            print(f"⚙️ Waiting for {pending} transcode job(s)...")
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+        with self._lock:
+            while self._finalizers:
+                self._idle.wait()
+
+    def shutdown(self):
+        self.wait()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._finalizer is not None:
+                self._finalizer.shutdown(wait=True)
+                self._finalizer = None
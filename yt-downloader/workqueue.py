@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+LEASE_SECONDS = 60
+# Parent of top-level tasks. Not NULL: UNIQUE treats every NULL as distinct,
+# so the same artist listed twice would be queued twice
+NO_PARENT = 0
+
+COLUMNS = (
+    ("worker", "TEXT"),
+    ("lease_until", "REAL"),
+    ("result", "TEXT"),
+    ("merged", "INTEGER DEFAULT 0"),
+)
+
+class WorkQueue:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit, with explicit IMMEDIATE transactions where several
+        # processes may race for the same rows
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        # Workers on other machines open the same file over a network filesystem,
+        # where WAL's shared-memory index does not work
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, run INTEGER, kind TEXT, url TEXT, parent INTEGER, "
+            "status TEXT, attempts INTEGER DEFAULT 0, payload TEXT, error TEXT, updated REAL, "
+            "UNIQUE (run, kind, url, parent))"
+        )
+        existing = {row["name"] for row in self._db.execute("PRAGMA table_info(tasks)")}
+        for name, decl in COLUMNS:
+            if name not in existing:
+                self._db.execute(f"ALTER TABLE tasks ADD COLUMN {name} {decl}")
+        self._db.execute("UPDATE OR IGNORE tasks SET parent = ? WHERE parent IS NULL", (NO_PARENT,))
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (run, status)")
+        self.run = None
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def start_run(self, urls, kind="artist", extra=()):
+        def start(db):
+            last = db.execute("SELECT MAX(run) AS run FROM tasks").fetchone()["run"]
+            if last is not None:
+                left = db.execute(
+                    "SELECT COUNT(*) AS n FROM tasks WHERE run = ? AND status IN (?, ?)", (last, PENDING, RUNNING)
+                ).fetchone()["n"]
+                if left:
+                    # Tasks whose owner died (no live lease) start over
+                    db.execute(
+                        "UPDATE tasks SET status = ?, worker = NULL WHERE run = ? AND status = ? "
+                        "AND (lease_until IS NULL OR lease_until < ?)",
+                        (PENDING, last, RUNNING, time.time()),
+                    )
+                    return last, False
+            run = (last or 0) + 1
+            now = time.time()
+            for task_kind, url in [(kind, url) for url in urls] + list(extra):
+                db.execute(
+                    "INSERT OR IGNORE INTO tasks (run, kind, url, parent, status, payload, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (run, task_kind, url, NO_PARENT, PENDING, "{}", now),
+                )
+            return run, True
+        self.run, started = self._transaction(start)
+        return started
+
+    def attach(self):
+        self.run = self._query("SELECT MAX(run) AS run FROM tasks")[0]["run"]
+        return self.run
+
+    def add(self, kind, url, parent=NO_PARENT, payload=None, status=PENDING):
+        cur = self._execute(
+            "INSERT OR IGNORE INTO tasks (run, kind, url, parent, status, payload, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.run, kind, url, parent, status, json.dumps(payload or {}), time.time()),
+        )
+        return cur.lastrowid
+
+    def claim(self, limit, kinds=None, worker=None, lease=None):
+        if limit <= 0:
+            return []
+        sql = "SELECT * FROM tasks WHERE run = ? AND status = ?"
+        args = [self.run, PENDING]
+        if kinds:
+            sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+            args += list(kinds)
+        sql += " ORDER BY id LIMIT ?"
+        args.append(limit)
+
+        def claim_rows(db):
+            rows = db.execute(sql, args).fetchall()
+            now = time.time()
+            for row in rows:
+                db.execute(
+                    "UPDATE tasks SET status = ?, attempts = attempts + 1, worker = ?, lease_until = ?, updated = ? WHERE id = ?",
+                    (RUNNING, worker, now + lease if lease else None, now, row["id"]),
+                )
+            return rows
+        return [dict(task_from_row(row), status=RUNNING, worker=worker) for row in self._transaction(claim_rows)]
+
+    def heartbeat(self, worker, lease=LEASE_SECONDS):
+        self._execute(
+            "UPDATE tasks SET lease_until = ? WHERE run = ? AND worker = ? AND status = ?",
+            (time.time() + lease, self.run, worker, RUNNING),
+        )
+
+    def reclaim_expired(self):
+        cur = self._execute(
+            "UPDATE tasks SET status = ?, worker = NULL, lease_until = NULL WHERE run = ? AND status = ? "
+            "AND lease_until IS NOT NULL AND lease_until < ?",
+            (PENDING, self.run, RUNNING, time.time()),
+        )
+        return cur.rowcount
+
+    def finish(self, task, ok, error=None, result=None):
+        # Only the current lease holder may finish a task: once a lease expired and
+        # the task went to another worker, the first worker's late result is dropped
+        cur = self._execute(
+            "UPDATE tasks SET status = ?, error = ?, result = ?, lease_until = NULL, updated = ? "
+            "WHERE id = ? AND status = ? AND worker IS ?",
+            (DONE if ok else FAILED, error, json.dumps(result) if result is not None else None, time.time(),
+             task["id"], RUNNING, task["worker"]),
+        )
+        if not cur.rowcount:
+            print(f"⚠️ Lost the lease on {task['kind']} {task['url']}, dropping its result.")
+            return False
+        return True
+
+    def unmerged(self, kinds):
+        rows = self._query(
+            f"SELECT * FROM tasks WHERE run = ? AND status IN (?, ?) AND merged = 0 AND kind IN ({','.join('?' * len(kinds))})",
+            [self.run, DONE, FAILED] + list(kinds),
+        )
+        return [task_from_row(row) for row in rows]
+
+    def mark_merged(self, task_id):
+        self._execute("UPDATE tasks SET merged = 1 WHERE id = ?", (task_id,))
+
+    def counts(self):
+        rows = self._query("SELECT kind, status, COUNT(*) AS n FROM tasks WHERE run = ? GROUP BY kind, status", (self.run,))
+        return {(row["kind"], row["status"]): row["n"] for row in rows}
+
+    def failures(self):
+        rows = self._query("SELECT * FROM tasks WHERE run = ? AND status = ?", (self.run, FAILED))
+        return [task_from_row(row) for row in rows]
+
+    def pending(self):
+        return self._query(
+            "SELECT COUNT(*) AS n FROM tasks WHERE run = ? AND status = ?",
+            (self.run, PENDING),
+        )[0]["n"]
+
+    def unfinished(self):
+        return self._query(
+            "SELECT COUNT(*) AS n FROM tasks WHERE run = ? AND status IN (?, ?)",
+            (self.run, PENDING, RUNNING),
+        )[0]["n"]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def task_from_row(row):
+    task = dict(row)
+    task["payload"] = json.loads(task["payload"] or "{}")
+    task["result"] = json.loads(task["result"]) if task.get("result") else None
+    return task